@@ -0,0 +1,120 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from src.google_clients.google_auth_client import GoogleAuthClient
+from src.google_clients.google_sheets_client import GoogleSheetsClient
+
+# Nothing is sent to Google unless a spreadsheet is given: the discovery document is bundled and credentials are
+# only used on the first request
+SPREADSHEET_ID = "benchmark"
+
+
+def _get_milliseconds(started_at: float, clients_number: int = 1) -> float:
+    return round((perf_counter() - started_at) * 1000 / clients_number, 3)
+
+
+# The way every client was constructed before the registry, discovery.build for each of them
+def measure_build(clients_number: int) -> float:
+    params = {
+        "scopes": GoogleSheetsClient.SCOPES,
+        "service_name": GoogleSheetsClient.SERVICE_NAME,
+        "version": GoogleSheetsClient.VERSION,
+    }
+
+    started_at = perf_counter()
+    for _ in range(clients_number):
+        GoogleAuthClient(params).build_service().spreadsheets()
+
+    return _get_milliseconds(started_at, clients_number)
+
+
+def measure_registry(clients_number: int) -> tuple[float, float]:
+    started_at = perf_counter()
+    GoogleSheetsClient(SPREADSHEET_ID)
+    first_client = _get_milliseconds(started_at)
+
+    started_at = perf_counter()
+    for _ in range(clients_number):
+        GoogleSheetsClient(SPREADSHEET_ID)
+
+    return first_client, _get_milliseconds(started_at, clients_number)
+
+
+def measure_threads(clients_number: int, threads_number: int) -> float:
+    def construct_clients() -> None:
+        for _ in range(clients_number):
+            GoogleSheetsClient(SPREADSHEET_ID)
+
+    started_at = perf_counter()
+    with ThreadPoolExecutor(max_workers=threads_number) as executor:
+        for _ in range(threads_number):
+            executor.submit(construct_clients)
+
+    return _get_milliseconds(started_at, clients_number * threads_number)
+
+
+# As wide as the arrow reports: numbers, text, empty cells and dates
+def make_wide_dataframe(rows_number: int, columns_number: int = 47, seed: int = 42) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    columns = {}
+
+    for index in range(columns_number):
+        match index % 4:
+            case 0:
+                columns[f"Q_{index}"] = rng.integers(0, 100, rows_number)
+            case 1:
+                columns[f"DB_{index}"] = pd.Series(rng.integers(0, 1000, rows_number)).map("Организация {}".format)
+            case 2:
+                columns[f"V_{index}"] = np.where(rng.random(rows_number) < 0.1, np.nan, rng.random(rows_number))
+            case 3:
+                seconds = pd.to_timedelta(rng.integers(0, 86_400 * 30, rows_number), unit="s")
+                columns[f"IVDate{index}"] = pd.Timestamp("2025-12-01") + seconds
+
+    return pd.DataFrame(columns)
+
+
+# Converting and chunking happen locally, the rest of the upload time is spent waiting for Google
+def measure_upload_preparation(df: pd.DataFrame) -> tuple[float, int]:
+    started_at = perf_counter()
+    values = GoogleSheetsClient._get_dataframe_values(df, include_header=True)
+    chunks = GoogleSheetsClient._split_into_chunks(values)
+
+    return _get_milliseconds(started_at), len(chunks)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measures GoogleSheetsClient construction and dataframe upload time")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=100_000, help="rows of the uploaded dataframe")
+    parser.add_argument("--spreadsheet-id", help="uploads the dataframe for real, needs Google API credentials")
+    parser.add_argument("--sheet-name", default="Benchmark")
+    args = parser.parse_args()
+
+    build_milliseconds = measure_build(args.clients)
+    print(f"discovery.build per client: {build_milliseconds} ms")
+
+    first_client_milliseconds, client_milliseconds = measure_registry(args.clients)
+    print(f"First GoogleSheetsClient with the registry: {first_client_milliseconds} ms")
+    print(f"Next GoogleSheetsClient with the registry: {client_milliseconds} ms")
+
+    threads_milliseconds = measure_threads(args.clients, args.threads)
+    print(f"GoogleSheetsClient in {args.threads} threads: {threads_milliseconds} ms per client")
+
+    df = make_wide_dataframe(args.rows)
+    preparation_milliseconds, chunks_number = measure_upload_preparation(df)
+    print(
+        f"Preparing {df.shape[0]}x{df.shape[1]} for the upload: {preparation_milliseconds} ms, {chunks_number} chunks"
+    )
+
+    if args.spreadsheet_id:
+        seconds = GoogleSheetsClient(args.spreadsheet_id).upload_dataframe(df, args.sheet_name)
+        print(f"Uploading {df.shape[0]}x{df.shape[1]}: {seconds:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import json
+import os
+import sys
+from dataclasses import asdict, dataclass
+from glob import glob
+
+import polars as pl
+
+# A worksheet holds at most 1 048 576 rows, bigger templates are split into several workbooks
+TEMPLATE_PART_ROWS = 1_000_000
+WORKSHEET_MAX_ROWS = 1_048_575
+
+# Multiplying by a number coprime with 10**9 permutes the subscriber numbers, so keys never collide
+NUMBERS_SPACE = 1_000_000_000
+NUMBERS_MULTIPLIER = 123_456_791
+NUMBERS_BASE = 79_000_000_000
+
+REGIONS = [
+    ("Москва", 77, "UTC +3"),
+    ("Самарская обл.", 63, "UTC +4"),
+    ("Калининградская обл.", 39, "UTC +2"),
+    ("Свердловская обл.", 66, "UTC +5"),
+    ("Омская обл.", 55, "UTC +6"),
+    ("Красноярский край", 24, "UTC +7"),
+    ("Иркутская обл.", 38, "UTC +8"),
+    ("Приморский край", 25, "UTC +10"),
+]
+OPERATORS = [("МТС", 1), ("Билайн", 2), ("МегаФон", 3), ("Т2", 4)]
+
+
+@dataclass
+class SurveyStudioDataParams:
+    rows: int
+    checklist_overlap: float = 0.1
+    blacklist_overlap: float = 0.05
+    duplicates_ratio: float = 0.01
+    invalid_ratio: float = 0.001
+    seed: int = 42
+
+
+def _make_numbers(start: int, count: int, seed: int) -> pl.Series:
+    indexes = pl.int_range(start, start + count, dtype=pl.Int64, eager=True) + seed * 7_919
+    subscriber_numbers = (indexes * NUMBERS_MULTIPLIER) % NUMBERS_SPACE
+
+    return NUMBERS_BASE + subscriber_numbers
+
+
+def _make_template(params: SurveyStudioDataParams) -> pl.DataFrame:
+    duplicates_number = int(params.rows * params.duplicates_ratio)
+    invalid_number = int(params.rows * params.invalid_ratio)
+    unique_number = params.rows - duplicates_number - invalid_number
+
+    numbers = _make_numbers(0, unique_number, params.seed)
+    tels = pl.concat(
+        [
+            numbers,
+            numbers.sample(duplicates_number, with_replacement=True, seed=params.seed),
+            pl.int_range(invalid_number, dtype=pl.Int64, eager=True) + 100_000,
+        ]
+    ).shuffle(seed=params.seed)
+
+    regions = pl.DataFrame(REGIONS, schema=["obl_name", "obl_code", "UTC_timediff"], orient="row")
+    operators = pl.DataFrame(OPERATORS, schema=["GrS_name", "GrS_code"], orient="row")
+
+    return (
+        pl.DataFrame({"tel": tels})
+        .with_columns(
+            (pl.col("tel") // 10_000_000 % len(regions)).alias("region_index"),
+            (pl.col("tel") % len(operators)).alias("operator_index"),
+        )
+        .join(regions.with_row_index("region_index").cast({"region_index": pl.Int64}), on="region_index")
+        .join(operators.with_row_index("operator_index").cast({"operator_index": pl.Int64}), on="operator_index")
+        .select("tel", "obl_name", "obl_code", "GrS_name", "GrS_code", "UTC_timediff")
+    )
+
+
+# Half of a list overlaps the template, the other half consists of numbers the template does not have
+def _make_exclusion_list(numbers: pl.Series, overlap: float, start: int, seed: int) -> pl.Series:
+    overlapping_number = int(len(numbers) * overlap)
+
+    return pl.concat(
+        [numbers.sample(overlapping_number, seed=seed), _make_numbers(start, overlapping_number, seed)]
+    ).shuffle(seed=seed)
+
+
+def _write_template(template: pl.DataFrame, data_path: str) -> list[str]:
+    file_names = []
+
+    for file_name in glob(f"{data_path}/BENCH_GEN_part*_template.xlsx"):
+        os.remove(file_name)
+
+    for index, offset in enumerate(range(0, len(template), TEMPLATE_PART_ROWS), start=1):
+        file_name = f"{data_path}/BENCH_GEN_part{index:02}_template.xlsx"
+        template.slice(offset, TEMPLATE_PART_ROWS).write_excel(file_name)
+        file_names.append(file_name)
+
+    return file_names
+
+
+# Generated workbooks are reused while the parameters stay the same, writing millions of rows takes minutes
+def generate_survey_studio_data(data_path: str, params: SurveyStudioDataParams) -> None:
+    params_file_name = f"{data_path}/params.json"
+
+    if os.path.exists(params_file_name):
+        with open(params_file_name, "r") as ifile:
+            if json.load(ifile) == asdict(params):
+                print(f"The benchmark data in {data_path} is up to date")
+                return
+
+    os.makedirs(data_path, exist_ok=True)
+    print(f"Generating the benchmark data with {params.rows} rows in {data_path}...")
+
+    template = _make_template(params)
+    _write_template(template, data_path)
+
+    numbers = template.get_column("tel").filter(template.get_column("tel") >= NUMBERS_BASE).unique(maintain_order=True)
+    checklist = _make_exclusion_list(numbers, params.checklist_overlap, params.rows, params.seed + 1)
+    blacklist = _make_exclusion_list(numbers, params.blacklist_overlap, params.rows * 2, params.seed + 2)
+
+    if max(len(checklist), len(blacklist)) > WORKSHEET_MAX_ROWS:
+        sys.exit("The checklist or the blacklist does not fit into a worksheet, lower the overlap ratios")
+
+    pl.DataFrame({"number": checklist}).write_excel(f"{data_path}/ПРОВЕРКА.xlsx", worksheet="Проверка")
+    pl.DataFrame({"Phone": blacklist.cast(pl.String)}).write_excel(f"{data_path}/ЧС.xlsx")
+
+    with open(params_file_name, "w") as ofile:
+        json.dump(asdict(params), ofile)
@@ -0,0 +1,173 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+from dataclasses import asdict
+from datetime import datetime
+from glob import glob
+from time import perf_counter
+
+from benchmarks import survey_studio_data_generator as data_generator
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+ROOT_PATH = os.path.dirname(BENCHMARKS_PATH)
+
+SIZES = {
+    "10k": 10_000,
+    "1m": 1_000_000,
+    "5m": 5_000_000,
+}
+
+
+def _get_peak_rss_mb(who: int) -> float:
+    peak_rss = resource.getrusage(who).ru_maxrss
+
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    if sys.platform == "darwin":
+        peak_rss /= 1024
+
+    return round(peak_rss / 1024, 1)
+
+
+def _get_commit() -> str | None:
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT_PATH, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return result.stdout.strip() or None
+
+
+# Runs inside a fresh process started in the work directory, so the peak RSS belongs to a single size. Templates
+# bigger than a worksheet are split into parts, the batch mode processes them with a single worker one by one
+def measure(result_file_name: str) -> None:
+    from src.tasks.make_file_for_survey_studio import SurveyStudioFileMaker
+
+    started_at = perf_counter()
+    maker = SurveyStudioFileMaker()
+    summaries = maker.run_batch()
+
+    failed_summaries = [summary for summary in summaries if "Error" in summary]
+    if failed_summaries:
+        sys.exit(f"{len(failed_summaries)} templates were not processed: {failed_summaries[0]['Error']}")
+
+    # The exclusion workbooks are parsed by this process, the templates by the workers
+    phases = dict(maker._phase_timer.seconds)
+    for summary in summaries:
+        for phase, seconds in summary["Phases"].items():
+            phases[phase] = phases.get(phase, 0.0) + seconds
+
+    result = {
+        "records": sum(summary["Records"] for summary in summaries),
+        "exported": sum(summary["Exported"] for summary in summaries),
+        "phases": {phase: round(seconds, 3) for phase, seconds in phases.items()},
+        "total_seconds": round(perf_counter() - started_at, 3),
+        "peak_rss_mb": _get_peak_rss_mb(resource.RUSAGE_SELF),
+        "peak_children_rss_mb": _get_peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+    with open(result_file_name, "w") as ofile:
+        json.dump(result, ofile)
+
+
+def _prepare_work_path(data_path: str, streaming: bool) -> str:
+    work_path = f"{data_path}/work"
+    shutil.rmtree(work_path, ignore_errors=True)
+    os.makedirs(f"{work_path}/results")
+
+    # The maker clears processed templates, so it gets copies of the generated workbooks
+    for file_name in glob(f"{data_path}/*.xlsx"):
+        shutil.copy(file_name, work_path)
+
+    config = {
+        "checklist_path": ".",
+        "blacklist_path": ".",
+        "results_path": "./results",
+        "templates_path": ".",
+        "cache_path": "./cache",
+        "ledger_path": "./results/export_ledger.sqlite3",
+        "streaming": streaming,
+        "shards_number": 2,
+        "batch_workers": 1,
+    }
+
+    with open(f"{work_path}/config.json", "w") as ofile:
+        json.dump(config, ofile, indent=4)
+
+    return work_path
+
+
+def run_size(size: str, params: data_generator.SurveyStudioDataParams, streaming: bool) -> dict:
+    data_path = f"{BENCHMARKS_PATH}/data/{size}"
+    data_generator.generate_survey_studio_data(data_path, params)
+
+    work_path = _prepare_work_path(data_path, streaming)
+    result_file_name = f"{work_path}/result.json"
+    command = [sys.executable, "-m", "benchmarks.survey_studio_file_maker", "--measure", result_file_name]
+    env = {**os.environ, "PYTHONPATH": ROOT_PATH}
+
+    print(f"Measuring {size} ({params.rows} rows, streaming: {streaming}), the log is in {work_path}/log.txt...")
+
+    with open(f"{work_path}/log.txt", "w") as log_file:
+        try:
+            subprocess.run(command, cwd=work_path, env=env, stdout=log_file, stderr=subprocess.STDOUT, check=True)
+        except subprocess.CalledProcessError:
+            sys.exit(f"The {size} benchmark failed, see {work_path}/log.txt")
+
+    with open(result_file_name, "r") as ifile:
+        measurement = json.load(ifile)
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _get_commit(),
+        "size": size,
+        "streaming": streaming,
+        "params": asdict(params),
+        **measurement,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks SurveyStudioFileMaker on generated workbooks")
+    parser.add_argument("--sizes", default="10k", help=f"comma separated sizes: {', '.join(SIZES)}")
+    parser.add_argument("--checklist-overlap", type=float, default=0.1)
+    parser.add_argument("--blacklist-overlap", type=float, default=0.05)
+    parser.add_argument("--duplicates-ratio", type=float, default=0.01)
+    parser.add_argument("--invalid-ratio", type=float, default=0.001)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--streaming", action="store_true")
+    parser.add_argument("--output", default=f"{BENCHMARKS_PATH}/results.jsonl")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure)
+        return
+
+    for size in args.sizes.split(","):
+        if size not in SIZES:
+            sys.exit(f"Unknown size {size}, expected one of: {', '.join(SIZES)}")
+
+        params = data_generator.SurveyStudioDataParams(
+            rows=SIZES[size],
+            checklist_overlap=args.checklist_overlap,
+            blacklist_overlap=args.blacklist_overlap,
+            duplicates_ratio=args.duplicates_ratio,
+            invalid_ratio=args.invalid_ratio,
+            seed=args.seed,
+        )
+        result = run_size(size, params, args.streaming)
+
+        # One JSON object per line, so results of different commits can be appended and compared
+        with open(args.output, "a") as ofile:
+            ofile.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+        phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in result["phases"].items())
+        print(f"{size}: {phases}, total {result['total_seconds']:.2f}s, peak RSS {result['peak_rss_mb']} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import Resource, build
+from googleapiclient.discovery import Resource, build, build_from_document
 
 from src.settings import GOOGLE_ACCESS_TOKEN, GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, GOOGLE_REFRESH_TOKEN
 
@@ -12,7 +12,7 @@ class GoogleAuthClient:
         self.service_name = params["service_name"]
         self.version = params["version"]
 
-    def build_service(self) -> Resource:
+    def get_credentials(self) -> Credentials:
         if not (GOOGLE_CLIENT_ID or GOOGLE_ACCESS_TOKEN or GOOGLE_CLIENT_SECRET):
             print("Google API credentials have not been configured.")
 
@@ -25,4 +25,10 @@ class GoogleAuthClient:
             client_secret=GOOGLE_CLIENT_SECRET,
         )
 
-        return build(credentials=credentials, serviceName=self.service_name, version=self.version)
+        return credentials
+
+    def build_service(self) -> Resource:
+        return build(credentials=self.get_credentials(), serviceName=self.service_name, version=self.version)
+
+    def build_service_from_document(self, document: dict) -> Resource:
+        return build_from_document(document, credentials=self.get_credentials())
@@ -0,0 +1,46 @@
+import json
+from threading import Lock, local
+
+from googleapiclient.discovery import Resource
+from googleapiclient.discovery_cache import get_static_doc
+
+from src.google_clients.google_auth_client import GoogleAuthClient
+
+
+class GoogleServicesRegistry:
+    _documents: dict[tuple[str, str], dict] = {}
+    _documents_lock = Lock()
+    _threads = local()
+
+    # Resources are built once per thread, their HTTP connection is not thread safe, every client of the thread
+    # shares them. Building a resource generates all of its methods, so nested resources are cached as well
+    @classmethod
+    def get_resource(cls, params: dict[str, str], *path: str) -> Resource:
+        if not hasattr(cls._threads, "resources"):
+            cls._threads.resources = {}
+
+        key = (params["service_name"], params["version"], tuple(params["scopes"]), *path)
+
+        if key not in cls._threads.resources:
+            if path:
+                parent = cls.get_resource(params, *path[:-1])
+                cls._threads.resources[key] = getattr(parent, path[-1])()
+            else:
+                document = cls._get_document(params["service_name"], params["version"])
+                cls._threads.resources[key] = GoogleAuthClient(params).build_service_from_document(document)
+
+        return cls._threads.resources[key]
+
+    # The discovery document bundled with googleapiclient is parsed once per process, nothing is downloaded
+    @classmethod
+    def _get_document(cls, service_name: str, version: str) -> dict:
+        with cls._documents_lock:
+            if (service_name, version) not in cls._documents:
+                document = get_static_doc(service_name, version)
+
+                if document is None:
+                    raise ValueError(f"There is no bundled discovery document for {service_name} {version}")
+
+                cls._documents[service_name, version] = json.loads(document)
+
+            return cls._documents[service_name, version]
@@ -1,25 +1,58 @@
+import json
+import math
+import random
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import zip_longest
+from time import perf_counter, sleep
 from typing import Any
 
+import numpy as np
+import pandas as pd
 from google.auth.exceptions import RefreshError
 from googleapiclient.discovery import Resource
 from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
 
-from src.google_clients.google_auth_client import GoogleAuthClient
+from src.google_clients.google_services_registry import GoogleServicesRegistry
+from src.types.google_sheets import AppendCellsRequest, RowMetadataRequest, SheetState
+from src.utils.rate_limiter import RateLimiter
 
 
 class GoogleSheetsClient:
     SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
     SERVICE_NAME = "sheets"
     VALUE_INPUT_OPTION = "RAW"
+    SHEET_STATE_FIELDS = (
+        "sheets(properties(sheetId),"
+        "data(rowData(values(formattedValue)),rowMetadata(developerMetadata(metadataKey,metadataValue))))"
+    )
+    GRID_PROPERTIES_FIELDS = "sheets(properties(sheetId,title,gridProperties(rowCount,columnCount)))"
+    DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
     VERSION = "v4"
 
+    # Sheets API allows 60 read and 60 write requests per minute per user, the limiters are shared by all clients
+    REQUESTS_PER_MINUTE = 60
+    READ_RATE_LIMITER = RateLimiter(60 / REQUESTS_PER_MINUTE)
+    WRITE_RATE_LIMITER = RateLimiter(60 / REQUESTS_PER_MINUTE)
+
+    MAX_RETRIES = 5
+    BACKOFF_SECONDS = 1
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    # Google recommends keeping a request payload under 2 MB
+    MAX_PAYLOAD_BYTES = 2_000_000
+    UPLOAD_WORKERS = 4
+
     def __init__(self, spreadsheet_id: str) -> None:
         self.sheet = self.get_service()
-        self.values = self.sheet.values()
+        self.values = self.get_service("values")
         self.spreadsheet_id = spreadsheet_id
+        self._pending: list[tuple[str, list[dict]]] = []
 
-    def get_service(self) -> Resource:
+    def get_service(self, *path: str) -> Resource:
         params = {
             "scopes": self.SCOPES,
             "service_name": self.SERVICE_NAME,
@@ -27,10 +60,7 @@ class GoogleSheetsClient:
         }
 
         try:
-            client = GoogleAuthClient(params)
-            service = client.build_service()
-
-            return service.spreadsheets()
+            return GoogleServicesRegistry.get_resource(params, "spreadsheets", *path)
 
         except HttpError as e:
             print(f"Error: {e}")
@@ -40,7 +70,7 @@ class GoogleSheetsClient:
         data = []
 
         try:
-            result = self.sheet.get(spreadsheetId=self.spreadsheet_id).execute()
+            result = self._execute(self.sheet.get(spreadsheetId=self.spreadsheet_id), self.READ_RATE_LIMITER)
             data = result.get("sheets", "")
 
         except RefreshError as e:
@@ -56,18 +86,59 @@ class GoogleSheetsClient:
 
         return None
 
+    # One request with a field mask returns the sheet ID, the key column and the rows metadata only, however long the
+    # sheet is. A key holds the value of a row in the key column and its metadata value, rows without the first one are
+    # skipped. Every row is expected to fill the key column, so their number tells where the next appended row lands
+    def get_sheet_state(self, sheet_name: str, key_column: str, metadata_key: str) -> SheetState | None:
+        try:
+            request = self.sheet.get(
+                spreadsheetId=self.spreadsheet_id,
+                ranges=[f"'{sheet_name}'!{key_column}:{key_column}"],
+                includeGridData=True,
+                fields=self.SHEET_STATE_FIELDS,
+            )
+            result = self._execute(request, self.READ_RATE_LIMITER)
+
+        except RefreshError as e:
+            print(f"Error: {e}")
+            return None
+
+        except HttpError as e:
+            print(f"Error: {e}")
+            return None
+
+        sheet = result["sheets"][0]
+        data = sheet.get("data", [{}])[0]
+        values = [row.get("values", [{}])[0].get("formattedValue", "") for row in data.get("rowData", [])]
+        metadata_values = [
+            next(
+                (
+                    metadata.get("metadataValue", "")
+                    for metadata in row.get("developerMetadata", [])
+                    if metadata.get("metadataKey") == metadata_key
+                ),
+                "",
+            )
+            for row in data.get("rowMetadata", [])
+        ]
+        keys = {key for key in zip_longest(values, metadata_values, fillvalue="") if key[0]}
+
+        return SheetState(sheet["properties"]["sheetId"], len(values), keys)
+
     def read_sheet(self, cells_range: str) -> list[list[Any]]:
         data = []
 
         try:
-            result = self.values.get(spreadsheetId=self.spreadsheet_id, range=cells_range).execute()
+            request = self.values.get(spreadsheetId=self.spreadsheet_id, range=cells_range)
+            result = self._execute(request, self.READ_RATE_LIMITER)
             data = result.get("values", [])
         except RefreshError as e:
             print(f"Error: {e}")
 
         return data
 
-    def write_values(self, values: list[list[Any]], cells_range: str) -> str | None:
+    # Like flush, a write that failed after the retries raises instead of being reported and skipped
+    def write_values(self, values: list[list[Any]], cells_range: str) -> str:
         data = [
             {"range": cells_range, "values": values},
         ]
@@ -78,24 +149,19 @@ class GoogleSheetsClient:
         }
 
         try:
-            result = self.values.batchUpdate(
-                spreadsheetId=self.spreadsheet_id,
-                body=body,
-            ).execute()
+            request = self.values.batchUpdate(spreadsheetId=self.spreadsheet_id, body=body)
+            result = self._execute(request, self.WRITE_RATE_LIMITER)
 
             rows = result.get("totalUpdatedRows")
             columns = result.get("totalUpdatedColumns")
             updated_range = result.get("responses")[0]["updatedRange"]
 
-            print(f"{rows} rows and {columns} columns inserted.")
+        except (HttpError, RefreshError) as e:
+            raise RuntimeError(f"The values were not written to {cells_range}: {e}") from e
 
-            return updated_range
+        print(f"{rows} rows and {columns} columns inserted.")
 
-        except RefreshError as e:
-            print(f"Error: {e}")
-
-        except HttpError as e:
-            print(f"Error: {e}")
+        return updated_range
 
     def append_values(self, values: list[list[Any]], cells_range: str) -> None:
         body = {
@@ -103,41 +169,96 @@ class GoogleSheetsClient:
         }
 
         try:
-            result = self.values.append(
+            request = self.values.append(
                 spreadsheetId=self.spreadsheet_id,
                 body=body,
                 range=cells_range,
                 valueInputOption=self.VALUE_INPUT_OPTION,
-            ).execute()
+            )
+            self._execute(request, self.WRITE_RATE_LIMITER)
 
-        except RefreshError as e:
-            print(f"Error: {e}")
-
-        except HttpError as e:
-            print(f"Error: {e}")
+        except (HttpError, RefreshError) as e:
+            raise RuntimeError(f"The values were not appended to {cells_range}: {e}") from e
 
-    def change_sheet(self, requests: list[dict]) -> None:
+    def change_sheet(self, requests: list[dict]) -> dict:
         body = {"requests": requests}
+        requests_string = ", ".join(next(iter(request)) for request in requests)
 
         try:
-            result = self.sheet.batchUpdate(
-                spreadsheetId=self.spreadsheet_id,
-                body=body,
-            ).execute()
+            request = self.sheet.batchUpdate(spreadsheetId=self.spreadsheet_id, body=body)
+            result = self._execute(request, self.WRITE_RATE_LIMITER)
 
-            requests_names = []
-            for request in requests:
-                requests_names.append(list(request.keys())[0])
-            requests_string = ", ".join(requests_names)
+        except (HttpError, RefreshError) as e:
+            raise RuntimeError(f"The requests {requests_string} were not applied to the sheet: {e}") from e
 
-            print(f"Requests applied to sheet: {requests_string}.")
-            return result
+        print(f"Requests applied to sheet: {requests_string}.")
 
-        except RefreshError as e:
-            print(f"Error: {e}")
+        return result
 
-        except HttpError as e:
-            print(f"Error: {e}")
+    def queue_values(self, values: list[list[Any]], cells_range: str) -> None:
+        self._queue("values", [{"range": cells_range, "values": values}])
+
+    def queue_requests(self, requests: list[dict]) -> None:
+        self._queue("requests", requests)
+
+    # Values and their format land together in one batchUpdate, the rows never exist unformatted
+    def queue_formatted_values(self, sheet_id: int, values: list[list[Any]], cell_format: dict) -> None:
+        request = AppendCellsRequest(sheet_id, values, cell_format)
+
+        self.queue_requests([request.to_dict()])
+
+    # Queued right after the rows they tag, the rows and their metadata land in one batchUpdate
+    def queue_rows_metadata(self, sheet_id: int, start_row_index: int, key: str, values: list[str]) -> None:
+        requests = [
+            RowMetadataRequest(sheet_id, start_row_index + index, key, value).to_dict()
+            for index, value in enumerate(values)
+        ]
+
+        self.queue_requests(requests)
+
+    # Consecutive writes of one kind are merged into one batch, so values and formatting still land in order
+    def _queue(self, kind: str, items: list[dict]) -> None:
+        if self._pending and self._pending[-1][0] == kind:
+            self._pending[-1][1].extend(items)
+        else:
+            self._pending.append((kind, list(items)))
+
+    # Sends the queued writes, a batch that could not be sent stays in the queue and the error is raised
+    def flush(self) -> None:
+        while self._pending:
+            kind, items = self._pending[0]
+
+            if kind == "values":
+                # A later write to the same range replaces the earlier one
+                items = list({item["range"]: item for item in items}.values())
+                body = {"data": items, "valueInputOption": self.VALUE_INPUT_OPTION}
+                request = self.values.batchUpdate(spreadsheetId=self.spreadsheet_id, body=body)
+            else:
+                request = self.sheet.batchUpdate(spreadsheetId=self.spreadsheet_id, body={"requests": items})
+
+            try:
+                self._execute(request, self.WRITE_RATE_LIMITER)
+            except (HttpError, RefreshError) as e:
+                raise RuntimeError(f"{len(items)} queued {kind} were not written to the spreadsheet: {e}") from e
+
+            self._pending.pop(0)
+            print(f"{len(items)} queued {kind} have been written to the spreadsheet.")
+
+    # Quota and server errors are retried with exponential backoff and jitter, other errors are raised at once
+    def _execute(self, request: HttpRequest, rate_limiter: RateLimiter) -> dict:
+        for attempt in range(self.MAX_RETRIES + 1):
+            rate_limiter.wait()
+
+            try:
+                return request.execute()
+
+            except HttpError as e:
+                if e.resp.status not in self.RETRY_STATUSES or attempt == self.MAX_RETRIES:
+                    raise
+
+                delay = self.BACKOFF_SECONDS * 2**attempt + random.uniform(0, self.BACKOFF_SECONDS)
+                print(f"Google Sheets API responded with {e.resp.status}, retrying in {delay:.1f} seconds...")
+                sleep(delay)
 
     def clear_sheet(self, sheet_id: int) -> None:
         format_requests = [
@@ -170,15 +291,187 @@ class GoogleSheetsClient:
         self.change_sheet(format_requests)
 
     # [1, 2, 3, 4, 5] --> "A:E"
-    # No longer than A:Z
-    @staticmethod
-    def get_cells_range(row: list[Any]) -> str:
+    @classmethod
+    def get_cells_range(cls, row: list[Any]) -> str:
         if len(row) == 0:
             return "A:A"
 
-        if len(row) > 26:
-            raise ValueError("Row is too long")
+        return f"A:{cls.get_column_letter(len(row))}"
+
+    # 1 --> "A", 26 --> "Z", 27 --> "AA", 47 --> "AU"
+    @staticmethod
+    def get_column_letter(column_number: int) -> str:
+        letters = ""
+
+        while column_number > 0:
+            column_number, remainder = divmod(column_number - 1, 26)
+            letters = chr(ord("A") + remainder) + letters
+
+        return letters
+
+    # Chunks are written concurrently within the write quota, so the time depends on the quota rather than on latency
+    def upload_dataframe(self, df: pd.DataFrame, sheet_name: str, include_header: bool = True) -> float:
+        started_at = perf_counter()
+        values = self._get_dataframe_values(df, include_header)
+
+        if not values:
+            print(f"There is nothing to upload to {sheet_name}.")
+            return 0.0
+
+        self._prepare_sheet(sheet_name, len(values), len(values[0]))
+        chunks = self._split_into_chunks(values)
+
+        with ThreadPoolExecutor(max_workers=min(self.UPLOAD_WORKERS, len(chunks))) as executor:
+            futures = [executor.submit(self._upload_chunk, sheet_name, *chunk) for chunk in chunks]
+
+            for future in futures:
+                try:
+                    future.result()
+                except (HttpError, RefreshError) as e:
+                    raise RuntimeError(f"The dataframe was not uploaded to {sheet_name}: {e}") from e
+
+        seconds = perf_counter() - started_at
+        print(
+            f"{len(values)} rows in {len(chunks)} chunks have been uploaded to {sheet_name} in {seconds:.1f} seconds."
+        )
+
+        return seconds
+
+    # Sheets takes strings, numbers and booleans only: dates become ISO strings, NaN and infinity become empty strings,
+    # which clear their cells unlike None. Object columns may hold anything, their values are converted one by one, the
+    # other columns at once
+    @classmethod
+    def _get_dataframe_values(cls, df: pd.DataFrame, include_header: bool) -> list[list[Any]]:
+        frame = df.copy()
+        object_columns = [
+            column
+            for column, dtype in frame.dtypes.items()
+            if pd.api.types.is_object_dtype(dtype) or isinstance(dtype, pd.CategoricalDtype)
+        ]
+        # Durations, periods and intervals have no JSON counterpart, they are written the way pandas prints them
+        string_columns = [
+            column
+            for column, dtype in frame.dtypes.items()
+            if pd.api.types.is_timedelta64_dtype(dtype) or isinstance(dtype, pd.PeriodDtype | pd.IntervalDtype)
+        ]
+
+        for column in frame.select_dtypes(include=["datetime", "datetimetz"]).columns:
+            frame[column] = frame[column].dt.strftime(cls.DATETIME_FORMAT)
+
+        for column in frame.select_dtypes(include="floating").columns:
+            frame[column] = frame[column].replace([math.inf, -math.inf], math.nan)
+
+        missing = frame.isna().to_numpy()
+
+        for column in string_columns:
+            frame[column] = frame[column].astype(str)
+
+        frame = frame.astype(object)
+
+        for column in object_columns:
+            frame[column] = frame[column].map(cls._get_json_value)
+
+        array = frame.to_numpy(dtype=object)
+        array[missing] = ""
+        values = array.tolist()
+
+        if include_header:
+            values.insert(0, [str(column) for column in frame.columns])
+
+        return values
+
+    @classmethod
+    def _get_json_value(cls, value: Any) -> Any:
+        if isinstance(value, np.datetime64):
+            value = pd.Timestamp(value)
+        elif isinstance(value, np.generic):
+            value = value.item()
+
+        if value is None or value is pd.NA or value is pd.NaT:
+            return ""
+
+        if isinstance(value, bool | int | str):
+            return value
+
+        if isinstance(value, float | Decimal):
+            return float(value) if math.isfinite(value) else ""
+
+        if isinstance(value, datetime):
+            return value.strftime(cls.DATETIME_FORMAT)
+
+        if isinstance(value, date):
+            return value.isoformat()
+
+        return str(value)
+
+    # Rows are grouped until the JSON payload would exceed the limit, a single bigger row still makes its own chunk
+    @classmethod
+    def _split_into_chunks(cls, values: list[list[Any]]) -> list[tuple[int, list[list[Any]]]]:
+        chunks = []
+        chunk_start = 0
+        chunk_size = 0
+
+        for row_index, row in enumerate(values):
+            row_size = len(json.dumps(row)) + 2
+
+            if chunk_size + row_size > cls.MAX_PAYLOAD_BYTES and row_index > chunk_start:
+                chunks.append((chunk_start, values[chunk_start:row_index]))
+                chunk_start = row_index
+                chunk_size = 0
+
+            chunk_size += row_size
+
+        chunks.append((chunk_start, values[chunk_start:]))
+
+        return chunks
+
+    def _upload_chunk(self, sheet_name: str, start_row_index: int, rows: list[list[Any]]) -> None:
+        # Resources belong to the thread that built them, the registry gives every upload thread its own one
+        values = self.get_service("values")
+        right_column = self.get_column_letter(len(rows[0]))
+        cells_range = f"'{sheet_name}'!A{start_row_index + 1}:{right_column}{start_row_index + len(rows)}"
+
+        body = {
+            "data": [{"range": cells_range, "values": rows}],
+            "valueInputOption": self.VALUE_INPUT_OPTION,
+        }
+
+        self._execute(values.batchUpdate(spreadsheetId=self.spreadsheet_id, body=body), self.WRITE_RATE_LIMITER)
+
+    # Values cannot be written outside of the grid, missing rows and columns are added before the upload. Values left
+    # below and to the right of the new ones by an earlier upload are cleared in the same request
+    def _prepare_sheet(self, sheet_name: str, rows_number: int, columns_number: int) -> None:
+        request = self.sheet.get(spreadsheetId=self.spreadsheet_id, fields=self.GRID_PROPERTIES_FIELDS)
+        sheets = self._execute(request, self.READ_RATE_LIMITER).get("sheets", [])
+        properties = next((sheet["properties"] for sheet in sheets if sheet["properties"]["title"] == sheet_name), None)
+
+        if properties is None:
+            raise ValueError(f"There is no sheet {sheet_name} in the spreadsheet")
+
+        sheet_id = properties["sheetId"]
+        grid_properties = properties["gridProperties"]
+        grid_rows_number = grid_properties.get("rowCount", 0)
+        grid_columns_number = grid_properties.get("columnCount", 0)
+
+        missing_dimensions = {
+            "ROWS": rows_number - grid_rows_number,
+            "COLUMNS": columns_number - grid_columns_number,
+        }
+
+        requests = [
+            {"appendDimension": {"sheetId": sheet_id, "dimension": dimension, "length": length}}
+            for dimension, length in missing_dimensions.items()
+            if length > 0
+        ]
+
+        if grid_rows_number > rows_number:
+            cells_range = {"sheetId": sheet_id, "startRowIndex": rows_number}
+            requests.append({"updateCells": {"range": cells_range, "fields": "userEnteredValue"}})
 
-        right_column_index = chr(ord("A") + len(row) - 1)
+        if grid_columns_number > columns_number:
+            cells_range = {"sheetId": sheet_id, "endRowIndex": rows_number, "startColumnIndex": columns_number}
+            requests.append({"updateCells": {"range": cells_range, "fields": "userEnteredValue"}})
 
-        return f"A:{right_column_index}"
+        if requests:
+            body = {"requests": requests}
+            self._execute(self.sheet.batchUpdate(spreadsheetId=self.spreadsheet_id, body=body), self.WRITE_RATE_LIMITER)
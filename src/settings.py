@@ -1,3 +1,4 @@
+import json
 import os
 
 # Google
@@ -9,3 +10,10 @@ GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 
 OPERATOR_WORK_TIME_SPREADSHEET_ID = os.getenv("OPERATOR_WORK_TIME_SPREADSHEET_ID")
 QUOTA_LINK = os.getenv("QUOTA_LINK")
+# Every project counts its completes on its own quota page: {"23-012345-67-C": "https://...", ...}
+QUOTA_LINKS: dict[str, str] = json.loads(os.getenv("QUOTA_LINKS", "{}"))
+
+# Survey Studio
+
+# The API answers one call log request per 60 seconds, the margin covers the clocks drift
+SURVEY_STUDIO_REQUESTS_INTERVAL_SECONDS = float(os.getenv("SURVEY_STUDIO_REQUESTS_INTERVAL_SECONDS", "62"))
@@ -1,3 +1,4 @@
+import os
 import sys
 from datetime import datetime
 
@@ -32,6 +33,19 @@ class BaseAutomation:
     def _get_token(self) -> str:
         return sys.argv[1]
 
+    # The projects are given as a comma separated list or as a file with one project per line, repeats are dropped
+    @staticmethod
+    def _get_projects() -> list[str]:
+        projects = sys.argv[2]
+
+        if os.path.isfile(projects):
+            with open(projects, "r") as ifile:
+                projects_list = ifile.read().split()
+        else:
+            projects_list = projects.split(",")
+
+        return list(dict.fromkeys(project.strip() for project in projects_list if project.strip()))
+
     def _get_date_from(self) -> str:
         if self._are_params_provided():
             yesterday = self._get_yesterday_date()
@@ -5,7 +5,7 @@ from zoneinfo import ZoneInfo
 
 import openpyxl
 import pandas as pd
-import sidetable
+import polars as pl
 from openpyxl.styles import Alignment, Font, PatternFill
 from survey_studio_clients.api_clients.outgoing_calls import SurveyStudioOutgoingCallsClient
 
@@ -15,6 +15,10 @@ from src.utils.get_yesterday import get_yesterday_date
 
 class CallsGroupsDailyReportMaker(BaseAutomation):
     PARAMS_NUMBER = 2
+    CALL_LOG_FLAG = True
+    COLUMNS = ["База контактов", "Результат"]
+    GRAND_TOTAL_LABEL = "grand_total"
+    SUBTOTAL_LABEL = "Итог"
 
     def __init__(self, client: SurveyStudioOutgoingCallsClient, yesterday: datetime) -> None:
         super().__init__(client)
@@ -30,7 +34,64 @@ class CallsGroupsDailyReportMaker(BaseAutomation):
         return sys.argv[2]
 
     def _get_raw_data(self) -> pd.DataFrame:
-        return self._ss_client.get_dataframe(self._project_id, self._date_from, self._date_from, True)
+        return self._ss_client.get_dataframe(self._project_id, self._date_from, self._date_from, self.CALL_LOG_FLAG)
+
+    # "База контактов" repeats a handful of values over millions of calls, so only its unique values are split
+    @classmethod
+    def _get_calls(cls, raw_data: pd.DataFrame) -> pl.DataFrame:
+        calls = pl.from_pandas(raw_data[cls.COLUMNS])
+
+        contact_bases = calls.select(pl.col("База контактов").unique()).with_columns(
+            pl.col("База контактов").str.split("_").alias("parts")
+        )
+        contact_bases = contact_bases.select(
+            "База контактов",
+            pl.col("parts").list.get(0, null_on_oob=True).cast(pl.Categorical).alias("Регион"),
+            pl.col("parts").list.get(1, null_on_oob=True).cast(pl.Categorical).alias("Оператор_связи"),
+        )
+
+        return calls.join(contact_bases, on="База контактов", how="left", nulls_equal=True)
+
+    # Every result column is a share of its own total, the subtotal of a region follows its operators and the grand
+    # total closes the table, the same layout sidetable subtotal gives
+    @classmethod
+    def _make_report(cls, calls: pl.DataFrame) -> pd.DataFrame:
+        index_columns = ["Регион", "Оператор_связи"]
+
+        counts = (
+            calls.drop_nulls(["Регион", "Оператор_связи", "Результат"])
+            .with_columns(pl.col(index_columns).cast(pl.String))
+            .group_by(*index_columns, "Результат")
+            .len()
+        )
+        results = sorted(counts.get_column("Результат").unique().to_list())
+
+        pivot = (
+            counts.pivot(on="Результат", index=index_columns, values="len")
+            .fill_null(0)
+            .sort(index_columns)
+            .select(*index_columns, *[(pl.col(result) / pl.col(result).sum()) * 100 for result in results])
+        )
+
+        subtotals = pivot.group_by("Регион").agg(pl.col(results).sum())
+        subtotals = subtotals.with_columns(
+            (pl.col("Регион") + f" - {cls.SUBTOTAL_LABEL}").alias("Оператор_связи"),
+        ).select(pivot.columns)
+
+        grand_total = pivot.select(
+            pl.lit(cls.GRAND_TOTAL_LABEL).alias("Регион"), pl.lit(" ").alias("Оператор_связи"), pl.col(results).sum()
+        )
+
+        report = (
+            pl.concat([pivot.with_columns(pl.lit(0).alias("order")), subtotals.with_columns(pl.lit(1).alias("order"))])
+            .sort("Регион", "order", maintain_order=True)
+            .drop("order")
+        )
+        report = pl.concat([report, grand_total])
+
+        index = pd.MultiIndex.from_arrays([report.get_column(column).to_list() for column in index_columns])
+
+        return pd.DataFrame({result: report.get_column(result).to_numpy() for result in results}, index=index).round(2)
 
     @staticmethod
     def _make_excel_workbook(df: pd.DataFrame) -> openpyxl.Workbook:
@@ -75,46 +136,25 @@ class CallsGroupsDailyReportMaker(BaseAutomation):
 
         return workbook
 
-    def _get_report_file_name(self) -> str:
+    @staticmethod
+    def _get_report_file_name(project_id: str, date_from: str) -> str:
         file_date = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        return f"./reports/report_calls_groups_{self._date_from}_{self._project_id}_{file_date}.xlsx"
+        return f"./reports/report_calls_groups_{date_from}_{project_id}_{file_date}.xlsx"
 
-    def run(self) -> None:
-        raw_data = self._get_raw_data()
-
-        reg = []
-        oper = []
+    # Also called by the outgoing calls suite with a call log it has already fetched, so it needs no client
+    @classmethod
+    def _save_report(cls, raw_data: pd.DataFrame, project_id: str, date_from: str) -> None:
         rows = []
 
         if len(raw_data) < 1:
-            rows.append(f"За {self._date_from} не было звонков")
+            rows.append(f"За {date_from} не было звонков")
             data = pd.DataFrame(rows)
-            file_name = self._get_report_file_name()
+            file_name = cls._get_report_file_name(project_id, date_from)
             return data.to_excel(file_name, index=False)
 
-        for _, row in raw_data.iterrows():
-            iter_row = row['База контактов']
-            reg.append(iter_row.split("_")[0])
-            oper.append(iter_row.split("_")[1])
-
-        raw_data['Регион'] = pd.Series(reg)
-        raw_data['Оператор_связи'] = pd.Series(oper)
+        pivot_stb = cls._make_report(cls._get_calls(raw_data))
 
-        pivot = pd.pivot_table(
-            raw_data,
-            index=["Регион", "Оператор_связи"],
-            columns=["Результат"],
-            aggfunc={"Результат": "count"},
-            fill_value=0,
-        )
-
-        pivot = pivot.rename(columns={"Результат": ""})
-        pivot.columns = [column[0] if column[0] else column[1] for column in pivot.columns]
-
-        pivot_total = (pivot / pivot.sum()) * 100
-        pivot_stb = pivot_total.stb.subtotal(sub_label="Итог").round(2)
-
-        file_name = self._get_report_file_name()
+        file_name = cls._get_report_file_name(project_id, date_from)
         # workbook = self._make_excel_workbook(pivot_stb)
         # workbook.save(file_name)
 
@@ -122,6 +162,9 @@ class CallsGroupsDailyReportMaker(BaseAutomation):
 
         print(f"File {file_name} has been successfully saved")
 
+    def run(self) -> None:
+        self._save_report(self._get_raw_data(), self._project_id, self._date_from)
+
 
 if __name__ == "__main__":
     yesterday = get_yesterday_date()
@@ -5,12 +5,12 @@ from zoneinfo import ZoneInfo
 
 import pandas as pd
 from survey_studio_clients.api_clients.operator_work_time import SurveyStudioOperatorWorkTimeClient
-from survey_studio_clients.web_scrapers.daily_counters import DailyCountersPageScraper
 
 from src.google_clients.google_sheets_client import GoogleSheetsClient
-from src.settings import OPERATOR_WORK_TIME_SPREADSHEET_ID, QUOTA_LINK
+from src.settings import OPERATOR_WORK_TIME_SPREADSHEET_ID, QUOTA_LINK, QUOTA_LINKS
 from src.tasks.base_automation import BaseAutomation
-from src.types.google_sheets import CellsRange, RepeatCellRequest
+from src.types.google_sheets import SheetState
+from src.utils.daily_counters_cache import DailyCountersCache
 from src.utils.get_yesterday import get_yesterday_date
 
 
@@ -40,37 +40,88 @@ class OperatorWorkTimeReportMaker(BaseAutomation):
         12: "декабря",
     }
 
-    PARAMS_NUMBER = 2
+    FOLDER_PATTERN = r"(?s)(?<!\d)20\d{2}(?!\d).?(.*)"
+
+    COUNTERS_CACHE_FOLDER = "./cache/daily_counters"
 
-    def __init__(self, client: SurveyStudioOperatorWorkTimeClient, yesterday: datetime) -> None:
+    PARAMS_NUMBER = 2
+    SHEET_NAME_MAX_LENGTH = 31
+
+    # Rows are told apart by the date and the project name, which is kept in the row metadata out of sight
+    DATE_COLUMN = "A"
+    PROJECT_METADATA_KEY = "operator_work_time_project"
+
+    def __init__(
+        self,
+        client: SurveyStudioOperatorWorkTimeClient,
+        yesterday: datetime,
+        counters_caches: dict[str, DailyCountersCache] | None = None,
+    ) -> None:
         super().__init__(client)
 
-        self._project_name = sys.argv[2]
-        self._scraper = DailyCountersPageScraper(QUOTA_LINK)
+        self._project_names = self._get_projects()
+        self._counters_caches = {} if counters_caches is None else counters_caches
 
         self._date_from = self._get_date_as_iso_string(yesterday)
         self._counter = self._get_date_as_survey_studio_counter(yesterday)
 
         self._sheets = GoogleSheetsClient(OPERATOR_WORK_TIME_SPREADSHEET_ID)
         self._sheet_name = "Отчёт для КМ"
+        self._sheet_state: SheetState | None = None
 
     @staticmethod
     def _show_usage_example() -> None:
         print("You have to specify your token and project name:\n")
-        print("\tpoetry run python src/tasks/get_operator_work_time.py yourtoken123 23-012345-67-C")
+        print("\tpoetry run python src/tasks/get_operator_work_time.py yourtoken123 23-012345-67-C\n")
+        print("Several projects can be given as a comma separated list or as a file with one project name per line:\n")
+        print("\tpoetry run python src/tasks/get_operator_work_time.py yourtoken123 23-012345-67-C,23-012346-67-C")
+        print("\tpoetry run python src/tasks/get_operator_work_time.py yourtoken123 projects.txt")
 
     def _get_raw_data(self) -> pd.DataFrame:
         return self._ss_client.get_dataframe(self._date_from, self._date_from)
 
-    def _does_report_already_exist(self, raw_data: pd.DataFrame) -> bool:
-        date = self._get_date_for_google_sheets(raw_data.iloc[0].iloc[1])
-        existing_rows = self._sheets.read_sheet(self._sheet_name)
+    # The sheet ID and the dates and projects of its rows are read once per run and kept up to date locally
+    def _get_sheet_state(self) -> SheetState:
+        if self._sheet_state is None:
+            self._sheet_state = self._sheets.get_sheet_state(
+                self._sheet_name, self.DATE_COLUMN, self.PROJECT_METADATA_KEY
+            )
+
+            if self._sheet_state is None:
+                print(f"Could not read the sheet {self._sheet_name}")
+                sys.exit(1)
+
+        return self._sheet_state
+
+    # Rows added before the project metadata have no project name, each of them stands for the whole day
+    def _does_report_already_exist(self, date: str, project_name: str) -> bool:
+        keys = self._get_sheet_state().keys
+
+        return (date, project_name) in keys or (date, "") in keys
 
-        for row in existing_rows:
-            if row[0] == date:
-                return True
+    # A project without a link in QUOTA_LINKS gets no completes rather than those of another project, only a single
+    # project may still take the common QUOTA_LINK
+    def _get_quota_link(self, project_name: str) -> str | None:
+        if project_name in QUOTA_LINKS:
+            return QUOTA_LINKS[project_name]
 
-        return False
+        if len(self._project_names) == 1:
+            return QUOTA_LINK
+
+        return None
+
+    # The counters table of a link is shared by all days of a backfill
+    def _get_completes_amount(self, project_name: str) -> int | None:
+        link = self._get_quota_link(project_name)
+
+        if link is None:
+            print(f"There is no quota link for the project {project_name}, its completes are left empty")
+            return None
+
+        if link not in self._counters_caches:
+            self._counters_caches[link] = DailyCountersCache(link, self.COUNTERS_CACHE_FOLDER)
+
+        return self._counters_caches[link].get_value_by_counter_name(self._counter)
 
     def _get_date_as_survey_studio_counter(self, dt: datetime) -> str:
         month = dt.month
@@ -78,12 +129,10 @@ class OperatorWorkTimeReportMaker(BaseAutomation):
 
         return f"{day} {self.MONTH_TO_STRING[month]}"
 
-    def _make_everyday_report(self, df: pd.DataFrame, completes_amount: int) -> tuple[list, pd.DataFrame]:
-        rows = []
-        date = self._get_date_for_google_sheets(df.iloc[0].iloc[1])
-        rows.append(date)
-
-        df = df[2:][:]
+    # The export covers every project of the day: two title rows, the header and the total row are dropped
+    @staticmethod
+    def _get_operators_data(raw_data: pd.DataFrame) -> pd.DataFrame:
+        df = raw_data[2:][:]
 
         new_header = df.iloc[0]
         df = df[1:]
@@ -91,46 +140,43 @@ class OperatorWorkTimeReportMaker(BaseAutomation):
         df.reset_index(inplace=True, drop=True)
         df = df.drop(df.index[-1])
 
-        df = df[df["Наименование"].str.contains(self._project_name, na=False)]
+        return df
+
+    def _make_everyday_report(
+        self, df: pd.DataFrame, date: str, completes_amount: int | None
+    ) -> tuple[list, pd.DataFrame]:
+        rows = [date]
         df = df.reset_index()
 
         columns_to_change = ["Готов", "Разговор", "Перезвон", "Звонков", "Всего"]
-        for c in columns_to_change:
-            df[c] = df[c].apply(lambda x: x / 3600)
+        df[columns_to_change] = df[columns_to_change].astype(float) / 3600
 
         count_oper_name = len(df["Оператор"].unique())
         rows.append(count_oper_name)
 
-        worktimes = []
-        for _, row in df.iterrows():
-            x = row["Готов"] + row["Разговор"] + row["Перезвон"] + row["Звонков"] * 3
-            if x > row["Всего"]:
-                x = row["Всего"]
-            worktimes.append(x)
-
-        df["Рабочее время"] = pd.Series(worktimes)
+        worktimes = df["Готов"] + df["Разговор"] + df["Перезвон"] + df["Звонков"] * 3
+        df["Рабочее время"] = worktimes.clip(upper=df["Всего"])
         work_time = round(df["Рабочее время"].sum(), 2)
         rows.append(work_time)
 
-        rows.append(completes_amount)
+        rows.append("" if completes_amount is None else completes_amount)
         cnt_recruites = df["Успешных"].sum()
         rows.append(cnt_recruites)
-        per_questionnaire = round((completes_amount / work_time), 2)
+        per_questionnaire = "" if completes_amount is None else round((completes_amount / work_time), 2)
         rows.append(per_questionnaire)
         per_recruits = round((cnt_recruites / work_time), 2)
         rows.append(per_recruits)
 
-        folders = df["Наименование"].unique()
-        res_folders = []
-        target_value = "2025"
+        rows.append(self._get_folders_string(df["Наименование"]))
 
-        for el in folders:
-            index = el.index(target_value)
-            res_folders.append(el[index + 5 :])
+        return rows, df
 
-        rows.append(", ".join(res_folders))
+    # "... 23-012345-67-C 2025_Волна 1" --> "Волна 1", the folder follows the year and one separator
+    def _get_folders_string(self, names: pd.Series) -> str:
+        folders = pd.Series(names.unique(), dtype=object)
+        folders = folders.str.extract(self.FOLDER_PATTERN, expand=False).fillna(folders)
 
-        return rows, df
+        return ", ".join(folders)
 
     def _get_date_for_google_sheets(self, dt: str) -> str:
         dt = datetime.strptime(dt, "%d.%m.%Y %H:%M")
@@ -142,48 +188,82 @@ class OperatorWorkTimeReportMaker(BaseAutomation):
         file_date = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
         return f"./reports/report_operator_work_time_{self._date_from}_{file_date}.xlsx"
 
-    def _get_last_row_index(self) -> int:
-        values = self._sheets.read_sheet(self._sheet_name)
+    # The day is fetched once and split by project locally, every project gets its own row and worksheet
+    def _make_everyday_reports(
+        self, raw_data: pd.DataFrame, date: str, project_names: list[str]
+    ) -> dict[str, tuple[list, pd.DataFrame]]:
+        operators_data = self._get_operators_data(raw_data)
+        reports = {}
 
-        return len(values) - 1
+        for project_name in project_names:
+            project_data = operators_data[operators_data["Наименование"].str.contains(project_name, na=False)]
 
-    def run(self) -> None:
-        raw_data = self._get_raw_data()
+            if project_data.empty:
+                print(f"There is no operator work time for the project {project_name} on {self._date_from}")
+                continue
 
-        if self._does_report_already_exist(raw_data):
-            print(f"The report for {self._date_from} already exists")
-            exit()
+            completes_amount = self._get_completes_amount(project_name)
+            reports[project_name] = self._make_everyday_report(project_data, date, completes_amount)
 
-        completes_amount = self._scraper.get_value_by_counter_name(self._counter)
-        rows, dataframe = self._make_everyday_report(raw_data, completes_amount)
+        return reports
 
+    def _save_report_file(self, reports: dict[str, tuple[list, pd.DataFrame]]) -> None:
         file_name = self._get_report_file_name()
-        dataframe.to_excel(file_name)
+
+        with pd.ExcelWriter(file_name) as writer:
+            for project_name, (_, dataframe) in reports.items():
+                dataframe.to_excel(writer, sheet_name=project_name[: self.SHEET_NAME_MAX_LENGTH])
 
         print(f"File {file_name} has been successfully saved")
 
-        self._sheets.append_values([rows], self._sheet_name)
+    def run(self) -> None:
+        raw_data = self._get_raw_data()
+        date = self._get_date_for_google_sheets(raw_data.iloc[0].iloc[1])
+
+        # Projects already in the sheet are skipped, so a run that added only some of them can be repeated
+        project_names = []
+        for project_name in self._project_names:
+            if self._does_report_already_exist(date, project_name):
+                print(f"The report of the project {project_name} for {self._date_from} already exists")
+            else:
+                project_names.append(project_name)
+
+        if not project_names:
+            exit()
+
+        reports = self._make_everyday_reports(raw_data, date, project_names)
 
-        sheet_id = self._sheets.get_sheet_id(self._sheet_name)
-        last_row_index = self._get_last_row_index()
+        if not reports:
+            print(f"There is nothing to add to the Google Sheet for {self._date_from}")
+            return
 
-        cells_range = CellsRange(sheet_id, last_row_index, last_row_index + 1, 0, 8)
-        request = RepeatCellRequest(cells_range, self.CELL_FORMAT)
-        format_requests = [request.to_dict()]
+        self._save_report_file(reports)
 
-        self._sheets.change_sheet(format_requests)
+        report_rows = [rows for rows, _ in reports.values()]
+        sheet_state = self._get_sheet_state()
+        self._sheets.queue_formatted_values(sheet_state.sheet_id, report_rows, self.CELL_FORMAT)
+        self._sheets.queue_rows_metadata(
+            sheet_state.sheet_id, sheet_state.rows_number, self.PROJECT_METADATA_KEY, list(reports)
+        )
+        self._sheets.flush()
 
-        print(f"A new row for {self._date_from} has been successfully added to the Google Sheet")
+        for project_name, (rows, _) in reports.items():
+            sheet_state.add_row((rows[0], project_name))
+
+        print(f"{len(report_rows)} new rows for {self._date_from} have been successfully added to the Google Sheet")
 
 
 if __name__ == "__main__":
     yesterday = get_yesterday_date()
     # yesterday = datetime(2025, 12, 2).astimezone(ZoneInfo("Europe/Moscow"))
 
+    # All days of a backfill share the counters tables of the quota links
+    counters_caches: dict[str, DailyCountersCache] = {}
+
     if yesterday.weekday() == 6:  # sunday # 3 - tuesday
         for delta in range(2, -1, -1):
             day = yesterday - timedelta(days=delta)
-            report_maker = OperatorWorkTimeReportMaker(SurveyStudioOperatorWorkTimeClient, day)
+            report_maker = OperatorWorkTimeReportMaker(SurveyStudioOperatorWorkTimeClient, day, counters_caches)
             report_maker.run()
             if delta != 0:
                 print(
@@ -191,5 +271,5 @@ if __name__ == "__main__":
                 )
                 sleep(62)
     else:
-        report_maker = OperatorWorkTimeReportMaker(SurveyStudioOperatorWorkTimeClient, yesterday)
+        report_maker = OperatorWorkTimeReportMaker(SurveyStudioOperatorWorkTimeClient, yesterday, counters_caches)
         report_maker.run()
@@ -1,110 +1,170 @@
 import sys
-from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from time import sleep
 from zoneinfo import ZoneInfo
 
-import openpyxl
+import numpy as np
 import pandas as pd
-from openpyxl.styles import Alignment, Font, PatternFill
+import xlsxwriter
 from survey_studio_clients.api_clients.outgoing_calls import SurveyStudioOutgoingCallsClient
 
 from src.params.results import RESULTS
+from src.settings import SURVEY_STUDIO_REQUESTS_INTERVAL_SECONDS
 from src.tasks.base_automation import BaseAutomation
 from src.utils.get_yesterday import get_yesterday_date
+from src.utils.rate_limiter import RateLimiter
 
 
 class OutgoingCallsDailyReportMaker(BaseAutomation):
     PARAMS_NUMBER = 2
+    CALL_LOG_FLAG = "null"
+    HEADER_ROWS_NUMBER = 3
+    MAX_WORKERS = 4
+    SUMMARY_SHEET_NAME = "Все проекты"
+
+    # Shared by every maker of the process, so the days of a weekend run and the suite keep to the API limit too
+    REQUESTS_INTERVAL_SECONDS = SURVEY_STUDIO_REQUESTS_INTERVAL_SECONDS
+    RATE_LIMITER = RateLimiter(REQUESTS_INTERVAL_SECONDS)
 
     def __init__(self, client: SurveyStudioOutgoingCallsClient, yesterday: datetime) -> None:
         super().__init__(client)
-        self._project_id = self._get_project_id()
+        self._project_ids = self._get_projects()
         self._date_from = self._get_date_as_iso_string(yesterday)
 
     @staticmethod
     def _show_usage_example() -> None:
         print("You have to specify both token and project ID:\n")
-        print("\tpoetry run python src/tasks/get_outgoing_calls.py yourtoken123 55555")
-
-    def _get_project_id(self) -> str:
-        return sys.argv[2]
+        print("\tpoetry run python src/tasks/get_outgoing_calls.py yourtoken123 55555\n")
+        print("Several projects can be given as a comma separated list or as a file with one project ID per line:\n")
+        print("\tpoetry run python src/tasks/get_outgoing_calls.py yourtoken123 55555,55556")
+        print("\tpoetry run python src/tasks/get_outgoing_calls.py yourtoken123 projects.txt")
 
-    def _get_raw_data(self) -> pd.DataFrame:
-        raw_data = self._ss_client.get_dataframe(self._project_id, self._date_from, self._date_from, 'null')
+    def _get_raw_data(self, project_id: str) -> pd.DataFrame:
+        raw_data = self._ss_client.get_dataframe(project_id, self._date_from, self._date_from, self.CALL_LOG_FLAG)
 
         return raw_data[["Результат", "Фактический канал"]]
 
+    # Calls without a channel are counted as "no_name", calls without a result still count into the channel totals
     @staticmethod
-    def _make_maps(data: pd.DataFrame) -> tuple[defaultdict, defaultdict]:
-        results_to_channel_map = defaultdict(lambda: defaultdict(int))
-        channels_counter_map = defaultdict(int)
+    def _make_crosstab(data: pd.DataFrame) -> tuple[pd.DataFrame, pd.Series]:
+        channels = data["Фактический канал"].fillna("no_name")
+        channels_counter = channels.value_counts()
+        channels_counter = channels_counter.reindex(sorted(channels_counter.index))
+
+        crosstab = data.groupby([data["Результат"], channels]).size().unstack(fill_value=0)
 
-        for _, row in data.iterrows():
-            result = row["Результат"]
-            channel = row["Фактический канал"]
-            if pd.isna(channel):
-                channel = "no_name"
+        unknown_results = crosstab.index.difference(RESULTS)
+        if len(unknown_results) > 0:
+            unknown_results_counter = crosstab.loc[unknown_results].sum(axis=1)
+            unknown_results_string = ", ".join(
+                f"{result} ({counter})" for result, counter in unknown_results_counter.items()
+            )
+            print(f"Results missing from the catalog were not included into the report: {unknown_results_string}")
 
-            results_to_channel_map[result][channel] += 1
-            channels_counter_map[channel] += 1
+        results_without_value_counter = data["Результат"].isna().sum()
+        if results_without_value_counter > 0:
+            print(f"{results_without_value_counter} calls without a result were counted only in the channel totals")
 
-        return results_to_channel_map, channels_counter_map
+        crosstab = crosstab.reindex(index=RESULTS, columns=channels_counter.index, fill_value=0)
 
-    def _make_report(self, results_to_channel_map: defaultdict, channels_counter_map: defaultdict) -> pd.DataFrame:
+        return crosstab, channels_counter
+
+    def _make_report(self, crosstab: pd.DataFrame, channels_counter: pd.Series) -> pd.DataFrame:
         rows = []
 
-        if not channels_counter_map:
+        if channels_counter.empty:
             rows.append(f"За {self._date_from} не было звонков")
             return pd.DataFrame(rows)
 
-        channels = sorted(channels_counter_map.keys())
+        channels = channels_counter.index.to_list()
 
         header = self._get_report_header(channels)
         rows.append(header)
-        rows.append([""] + ["Количество", "Процент"] * (len(channels_counter_map.keys()) + 1))
+        rows.append([""] + ["Количество", "Процент"] * (len(channels) + 1))
         rows.append(["Результат"])
 
-        channels_total = 0
-        results_total_over_all_channels = defaultdict(int)
+        channels_total = int(channels_counter.sum())
+        counts = crosstab.to_numpy()
+        results_totals = counts.sum(axis=1)
 
-        for channel in channels:
-            channels_total += channels_counter_map[channel]
+        # Quantity and percent columns of every channel go in turn
+        channels_columns = np.empty(counts.shape[:1] + (counts.shape[1] * 2,), dtype=object)
+        channels_columns[:, 0::2] = counts
+        channels_columns[:, 1::2] = counts / channels_counter.to_numpy()
+
+        for result, channels_values, result_total in zip(
+            crosstab.index, channels_columns.tolist(), results_totals.tolist()
+        ):
+            rows.append([result] + channels_values + [str(result_total), result_total / channels_total])
+
+        row = ["Total"]
+        for channel_total in channels_counter.tolist():
+            row.append(channel_total)
+            row.append(1)
+
+        row += [channels_total, 1]
+        rows.append(row)
 
-        for result in RESULTS:
-            total_result_over_all_channels = 0
+        return pd.DataFrame(rows)
 
-            for channel in channels:
-                channel_per_result = results_to_channel_map[result].get(channel, 0)
-                total_result_over_all_channels += channel_per_result
+    def _get_call_log(self, project_id: str) -> pd.DataFrame:
+        self.RATE_LIMITER.wait()
+        raw_data = self._get_raw_data(project_id)
+        print(f"The call log of the project {project_id} with {len(raw_data)} calls was received")
 
-            results_total_over_all_channels[result] = total_result_over_all_channels
+        return raw_data
 
-        for result in RESULTS:
-            row = [result]
+    @staticmethod
+    def _add_to_summary(
+        summary: tuple[pd.DataFrame, pd.Series], crosstab: pd.DataFrame, channels_counter: pd.Series
+    ) -> tuple[pd.DataFrame, pd.Series]:
+        summary_crosstab, summary_channels_counter = summary
 
-            for channel in channels:
-                channels_per_result = results_to_channel_map.get(result, {})
-                channel_per_result = channels_per_result.get(channel, 0)
-                channel_total = channels_counter_map[channel]
-                per_cent = channel_per_result / channel_total
+        summary_channels_counter = summary_channels_counter.add(channels_counter, fill_value=0).astype("int64")
+        summary_channels_counter = summary_channels_counter.reindex(sorted(summary_channels_counter.index))
 
-                row += [channel_per_result, per_cent]
+        summary_crosstab = summary_crosstab.add(crosstab, fill_value=0).fillna(0).astype("int64")
+        summary_crosstab = summary_crosstab.reindex(index=RESULTS, columns=summary_channels_counter.index)
 
-            row.append(str(results_total_over_all_channels[result]))
-            row.append(results_total_over_all_channels[result] / channels_total)
+        return summary_crosstab, summary_channels_counter
 
-            rows.append(row)
+    # Call logs are fetched on a bounded pool and handed over as soon as they arrive, failed projects are skipped
+    def _get_call_logs(self) -> Iterator[tuple[str, pd.DataFrame]]:
+        workers_number = min(self.MAX_WORKERS, len(self._project_ids))
 
-        row = ["Total"]
-        for channel in channels:
-            row.append(channels_counter_map[channel])
-            row.append(1)
+        with ThreadPoolExecutor(max_workers=workers_number) as executor:
+            futures = {executor.submit(self._get_call_log, project_id): project_id for project_id in self._project_ids}
 
-        row += [channels_total, 1]
-        rows.append(row)
+            for future in as_completed(futures):
+                project_id = futures[future]
 
-        return pd.DataFrame(rows)
+                # Request errors of requests are OSErrors, a malformed call log fails on parsing or on missing columns
+                try:
+                    call_log = future.result()
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"The project {project_id} was not processed: {e}")
+                    continue
+
+                yield project_id, call_log
+
+    # Every project is aggregated as soon as its call log arrives
+    def _make_reports(self, call_logs: Iterable[tuple[str, pd.DataFrame]]) -> dict[str, pd.DataFrame]:
+        reports = {}
+        summary = pd.DataFrame(index=RESULTS, dtype="int64"), pd.Series(dtype="int64")
+
+        for project_id, call_log in call_logs:
+            crosstab, channels_counter = self._make_crosstab(call_log)
+
+            reports[project_id] = self._make_report(crosstab, channels_counter)
+            summary = self._add_to_summary(summary, crosstab, channels_counter)
+
+        reports = {project_id: reports[project_id] for project_id in self._project_ids if project_id in reports}
+
+        if len(self._project_ids) > 1 and reports:
+            reports = {self.SUMMARY_SHEET_NAME: self._make_report(*summary)} | reports
+
+        return reports
 
     @staticmethod
     def _get_report_header(channels: list) -> list[str]:
@@ -118,64 +178,72 @@ class OutgoingCallsDailyReportMaker(BaseAutomation):
 
         return header
 
-    @staticmethod
-    def _make_excel_workbook(df: pd.DataFrame) -> openpyxl.Workbook:
-        workbook = openpyxl.Workbook()
-        worksheet = workbook.active
-
-        for _, row in df.iterrows():
-            worksheet.append(row.to_list())
-
-        worksheet.column_dimensions["A"].width = 50
-        worksheet.column_dimensions["B"].width = 10
-        worksheet.column_dimensions["C"].width = 10
-        worksheet.column_dimensions["D"].width = 10
-        worksheet.column_dimensions["E"].width = 10
-        worksheet.column_dimensions["F"].width = 10
-        worksheet.column_dimensions["G"].width = 10
-        worksheet.column_dimensions["H"].width = 10
-        worksheet.column_dimensions["I"].width = 10
+    # Every cell shares one of four cached formats and rows are flushed as they are written, so neither time nor memory
+    # depend on the number of styled cells
+    @classmethod
+    def _write_excel_file(cls, reports: dict[str, pd.DataFrame], file_name: str) -> None:
+        workbook = xlsxwriter.Workbook(file_name, {"constant_memory": True})
+        formats = cls._add_formats(workbook)
 
-        for i in range(len(df.columns)):
-            if i == 0:
-                continue
+        # In the constant memory mode a worksheet is flushed before the next one is started
+        for sheet_name, df in reports.items():
+            cls._write_worksheet(workbook.add_worksheet(sheet_name), df, formats)
 
-            next_letter_code = ord("A") + i
+        workbook.close()
 
-            if next_letter_code % 2 == 1:
-                for cell in worksheet[chr(next_letter_code)]:
-                    cell.number_format = "0.00%"
-
-        alignment = Alignment(horizontal="center", vertical="center", wrapText=True)
-        font = Font(color="000000", bold=True)
-        fill = PatternFill(fill_type="solid", fgColor="FFFF00")
-
-        for row_index, row in enumerate(worksheet.iter_rows()):
-            if row_index in (0, 1, 2):
-                for cell in row[1:]:
-                    cell.font = font
-                    cell.fill = fill
-
-            for cell in row:
-                cell.alignment = alignment
-
-        return workbook
+    @staticmethod
+    def _add_formats(workbook: xlsxwriter.Workbook) -> dict[tuple[bool, bool], xlsxwriter.format.Format]:
+        alignment = {"align": "center", "valign": "vcenter", "text_wrap": True}
+        percent = {"num_format": "0.00%"}
+        highlight = {"bold": True, "font_color": "#000000", "pattern": 1, "bg_color": "#FFFF00"}
+
+        formats = {}
+        for is_highlighted in (False, True):
+            for is_percent in (False, True):
+                properties = alignment | (highlight if is_highlighted else {}) | (percent if is_percent else {})
+                formats[is_highlighted, is_percent] = workbook.add_format(properties)
+
+        return formats
+
+    @classmethod
+    def _write_worksheet(
+        cls,
+        worksheet: xlsxwriter.worksheet.Worksheet,
+        df: pd.DataFrame,
+        formats: dict[tuple[bool, bool], xlsxwriter.format.Format],
+    ) -> None:
+        # xlsxwriter pads character widths, pixels match the raw widths of 50 and 10 characters
+        worksheet.set_column_pixels(0, 0, 350)
+        worksheet.set_column_pixels(1, 8, 70)
+
+        is_percent_column = [index >= 2 and index % 2 == 0 for index in range(len(df.columns))]
+        header_formats = [formats[index > 0, is_percent] for index, is_percent in enumerate(is_percent_column)]
+        body_formats = [formats[False, is_percent] for is_percent in is_percent_column]
+
+        for row_index, row in enumerate(df.itertuples(index=False, name=None)):
+            row_formats = header_formats if row_index < cls.HEADER_ROWS_NUMBER else body_formats
+
+            for column_index, value in enumerate(row):
+                worksheet.write(row_index, column_index, value, row_formats[column_index])
 
     def _get_report_file_name(self) -> str:
         file_date = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        return f"./reports/{self._project_id}_{self._date_from}_report_outgoing_calls_{file_date}.xlsx"
+        projects = self._project_ids[0] if len(self._project_ids) == 1 else f"{len(self._project_ids)}_projects"
 
-    def run(self) -> None:
-        raw_data = self._get_raw_data()
-        results_to_channel_map, channels_counter_map = self._make_maps(raw_data)
+        return f"./reports/{projects}_{self._date_from}_report_outgoing_calls_{file_date}.xlsx"
 
-        report_df = self._make_report(results_to_channel_map, channels_counter_map)
-        workbook = self._make_excel_workbook(report_df)
+    def _save_reports(self, reports: dict[str, pd.DataFrame]) -> None:
+        if not reports:
+            sys.exit("No project was processed")
 
         file_name = self._get_report_file_name()
-        workbook.save(file_name)
+        self._write_excel_file(reports, file_name)
+
         print(f"File {file_name} has been successfully saved")
 
+    def run(self) -> None:
+        self._save_reports(self._make_reports(self._get_call_logs()))
+
 
 if __name__ == "__main__":
     yesterday = get_yesterday_date()
@@ -186,11 +254,6 @@ if __name__ == "__main__":
             day = yesterday - timedelta(days=delta)
             report_maker = OutgoingCallsDailyReportMaker(SurveyStudioOutgoingCallsClient, day)
             report_maker.run()
-            if delta != 0:
-                print(
-                    "Waiting for 62 seconds because Survey Studio API allows only one request to requestoperatorworktime per 60 seconds..."
-                )
-                sleep(62)
     else:
         report_maker = OutgoingCallsDailyReportMaker(SurveyStudioOutgoingCallsClient, yesterday)
         report_maker.run()
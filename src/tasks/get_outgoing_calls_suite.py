@@ -0,0 +1,105 @@
+import sys
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timedelta
+
+import pandas as pd
+from survey_studio_clients.api_clients import outgoing_calls
+
+from src.tasks.get_calls_groups import CallsGroupsDailyReportMaker
+from src.tasks.get_outgoing_calls import OutgoingCallsDailyReportMaker
+from src.utils.get_yesterday import get_yesterday_date
+
+
+class OutgoingCallsSuiteMaker(OutgoingCallsDailyReportMaker):
+    COLUMNS = ["Результат", "Фактический канал", "База контактов"]
+
+    # The two reports ask for the call log with different flags, which call logs differ by could not be checked against
+    # the API. The calls groups flag is used because "База контактов" comes with it, so the outgoing calls report of
+    # the suite is saved under its own name until --compare-flags shows that both flags give the same crosstab
+    CALL_LOG_FLAG = CallsGroupsDailyReportMaker.CALL_LOG_FLAG
+    OUTGOING_CALLS_COLUMNS = ["Результат", "Фактический канал"]
+
+    def __init__(self, client: outgoing_calls.SurveyStudioOutgoingCallsClient, yesterday: datetime) -> None:
+        super().__init__(client, yesterday)
+        self._calls_groups_data: dict[str, pd.DataFrame] = {}
+
+    @staticmethod
+    def _show_usage_example() -> None:
+        print("You have to specify both token and project ID:\n")
+        print("\tpoetry run python src/tasks/get_outgoing_calls_suite.py yourtoken123 55555\n")
+        print("Several projects can be given as a comma separated list or as a file with one project ID per line:\n")
+        print("\tpoetry run python src/tasks/get_outgoing_calls_suite.py yourtoken123 55555,55556")
+        print("\tpoetry run python src/tasks/get_outgoing_calls_suite.py yourtoken123 projects.txt\n")
+        print("The outgoing calls crosstabs of the first project built from both call log flags are compared with:\n")
+        print("\tpoetry run python src/tasks/get_outgoing_calls_suite.py yourtoken123 55555 --compare-flags")
+
+    # One request per project feeds both reports
+    def _get_raw_data(self, project_id: str) -> pd.DataFrame:
+        raw_data = self._ss_client.get_dataframe(project_id, self._date_from, self._date_from, self.CALL_LOG_FLAG)
+
+        return raw_data[self.COLUMNS]
+
+    # Call logs arrive on this thread, the outgoing calls report takes its columns and the calls groups ones are kept
+    def _split_call_logs(self, call_logs: Iterable[tuple[str, pd.DataFrame]]) -> Iterator[tuple[str, pd.DataFrame]]:
+        for project_id, call_log in call_logs:
+            self._calls_groups_data[project_id] = call_log[CallsGroupsDailyReportMaker.COLUMNS]
+
+            yield project_id, call_log[self.OUTGOING_CALLS_COLUMNS]
+
+    def _get_report_file_name(self) -> str:
+        file_date = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        projects = self._project_ids[0] if len(self._project_ids) == 1 else f"{len(self._project_ids)}_projects"
+
+        return f"./reports/{projects}_{self._date_from}_report_outgoing_calls_suite_{file_date}.xlsx"
+
+    # The call logs of both flags are fetched for the first project and the crosstabs built from them are compared
+    def compare_call_log_flags(self) -> bool:
+        project_id = self._project_ids[0]
+        crosstabs = []
+
+        for flag in (OutgoingCallsDailyReportMaker.CALL_LOG_FLAG, self.CALL_LOG_FLAG):
+            self.RATE_LIMITER.wait()
+            raw_data = self._ss_client.get_dataframe(project_id, self._date_from, self._date_from, flag)
+            print(f"The call log of the project {project_id} with the flag {flag} has {len(raw_data)} calls")
+
+            crosstabs.append(self._make_crosstab(raw_data[self.OUTGOING_CALLS_COLUMNS]))
+
+        (crosstab, channels_counter), (suite_crosstab, suite_channels_counter) = crosstabs
+        is_same = crosstab.equals(suite_crosstab) and channels_counter.equals(suite_channels_counter)
+
+        if is_same:
+            print(f"Both flags give the same outgoing calls crosstab for the project {project_id} on {self._date_from}")
+        else:
+            print(
+                f"The flags give different outgoing calls crosstabs for the project {project_id} on {self._date_from}"
+            )
+
+        return is_same
+
+    def run(self) -> None:
+        print(
+            f"The outgoing calls report is built from the call log with the flag {self.CALL_LOG_FLAG}, the standalone "
+            f"report uses {OutgoingCallsDailyReportMaker.CALL_LOG_FLAG}"
+        )
+        self._save_reports(self._make_reports(self._split_call_logs(self._get_call_logs())))
+
+        for project_id, calls in self._calls_groups_data.items():
+            CallsGroupsDailyReportMaker._save_report(calls, project_id, self._date_from)
+
+
+if __name__ == "__main__":
+    yesterday = get_yesterday_date()
+
+    if "--compare-flags" in sys.argv:
+        sys.argv.remove("--compare-flags")
+        suite_maker = OutgoingCallsSuiteMaker(outgoing_calls.SurveyStudioOutgoingCallsClient, yesterday)
+        sys.exit(0 if suite_maker.compare_call_log_flags() else 1)
+
+    if yesterday.weekday() == 6:  # sunday
+        for delta in range(2, -1, -1):
+            day = yesterday - timedelta(days=delta)
+            suite_maker = OutgoingCallsSuiteMaker(outgoing_calls.SurveyStudioOutgoingCallsClient, day)
+            suite_maker.run()
+    else:
+        suite_maker = OutgoingCallsSuiteMaker(outgoing_calls.SurveyStudioOutgoingCallsClient, yesterday)
+        suite_maker.run()
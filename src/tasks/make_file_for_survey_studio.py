@@ -1,11 +1,55 @@
 import json
+import os
+import sqlite3
 import sys
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from glob import glob
+from multiprocessing import get_context
+from tempfile import TemporaryDirectory
+from time import perf_counter, sleep, time
+from typing import Any
+from zipfile import BadZipFile
 
 import polars as pl
+import xlsxwriter
+from fastexcel import FastExcelError
+from xlsx2csv import Xlsx2csv
+
+from src.types.input_files import InputFiles
+from src.utils.concurrent_loader import load_concurrently
+from src.utils.export_ledger import ExportLedger
+from src.utils.input_files_discovery import InputFileNotFoundError, InputFilesDiscovery
+from src.utils.numbering_plan import NumberingPlan
+from src.utils.numbers_index_cache import NumbersIndexCache
+from src.utils.phase_timer import PhaseTimer
+from src.utils.phone_numbers import get_phone_number_key
+
+
+# A template the checks reject, only a single run exits on it
+class TemplateError(Exception):
+    pass
 
 
 class SurveyStudioFileMaker:
+    BATCH_SUMMARY_COLUMNS = ["Template", "Source", "Records", "Exported", "Files", "Seconds", "Error"]
+    EXCEL_CHUNK_SIZE = 100_000
+    SKIP_REASONS = pl.Enum(["invalid", "numbering_plan", "duplicate", "checklist", "blacklist", "exported"])
+    # A broken, busy or rejected template fails alone
+    TEMPLATE_ERRORS = (
+        TemplateError,
+        OSError,
+        ValueError,
+        BadZipFile,
+        FastExcelError,
+        pl.exceptions.PolarsError,
+        sqlite3.Error,
+    )
+    TEMPLATE_COLUMNS = ["tel", "obl_name", "obl_code", "GrS_name", "GrS_code", "UTC_timediff"]
+    WATCH_INTERVAL = 5
+    WATCH_SETTLE_SECONDS = 2
+
     TIMEZONES = {
         "UTC +3": "Europe / Moscow",
         "UTC +4": "Europe / Samara",
@@ -23,74 +67,74 @@ class SurveyStudioFileMaker:
     def __init__(self):
         self.config = self._get_config()
 
+        cache_path = self.config.get("cache_path", "./cache")
+        self._checklist_cache = NumbersIndexCache(cache_path, "checklist")
+        self._blacklist_cache = NumbersIndexCache(cache_path, "blacklist")
+
+        ledger_path = self.config.get("ledger_path", f"{self.config['results_path']}/export_ledger.sqlite3")
+        self._ledger = ExportLedger(ledger_path)
+
+        numbering_plan_path = self.config.get("numbering_plan_path", "")
+        self._numbering_plan = NumberingPlan(numbering_plan_path) if numbering_plan_path else None
+
+        self._discovery = InputFilesDiscovery(self.config, self._get_template_columns())
+        self._phase_timer = PhaseTimer()
+
     @staticmethod
     def _get_config() -> dict:
         with open("config.json", "r") as ifile:
             return json.load(ifile)
 
-    def _make_checklist(self) -> dict[str, bool]:
-        checklist = {}
+    # Region, operator and timezone are taken from the numbering plan when the template does not have them
+    def _get_template_columns(self) -> list[str]:
+        if self._numbering_plan is not None:
+            return ["tel"]
 
-        checklist_file_name = ""
-        for file_name in glob(f"{self.config['checklist_path']}/*"):
-            if "ПРОВЕРКА" not in file_name:
-                continue
+        return self.TEMPLATE_COLUMNS
 
-            checklist_file_name = file_name
+    def _discover_input_files(self) -> InputFiles:
+        try:
+            return self._discovery.discover()
+        except InputFileNotFoundError as e:
+            sys.exit(str(e))
 
-        if not checklist_file_name:
-            sys.exit("The ПРОВЕРКА file was not found")
+    def _make_checklist(self, checklist_file_name: str) -> pl.DataFrame:
+        return self._checklist_cache.load(checklist_file_name, self._read_checklist)
 
+    def _read_checklist(self, checklist_file_name: str) -> pl.DataFrame:
         df = pl.read_excel(checklist_file_name, sheet_name="Проверка", read_options={"use_columns": ["number"]})
-        for row in df.iter_rows(named=True):
-            checklist[str(row["number"])] = True
 
-        return checklist
+        return self._make_numbers_list(df, "number")
 
-    def _make_blacklist(self) -> dict[str, bool]:
-        blacklist = {}
-
-        blacklist_file_name = ""
-        for file_name in glob(f"{self.config['blacklist_path']}/*"):
-            if "ЧС" not in file_name:
-                continue
-            blacklist_file_name = file_name
-
-        if not blacklist_file_name:
-            sys.exit("The black list file was not found")
+    def _make_blacklist(self, blacklist_file_name: str) -> pl.DataFrame:
+        return self._blacklist_cache.load(blacklist_file_name, self._read_blacklist)
 
+    def _read_blacklist(self, blacklist_file_name: str) -> pl.DataFrame:
         df = pl.read_excel(blacklist_file_name, read_options={"use_columns": ["Phone"]})
-        for row in df.iter_rows(named=True):
-            blacklist[str(row["Phone"])] = True
-
-        return blacklist
 
-    def _find_template_file_name(self) -> str:
-        template_file_name = ""
+        return self._make_numbers_list(df, "Phone")
 
-        for file_name in glob(f"{self.config['templates_path']}/*"):
-            if "template" in file_name or "Temp" in file_name:
-                if not self._check_if_file_has_data(file_name):
-                    continue
-
-                template_file_name = file_name
+    @staticmethod
+    def _make_numbers_list(df: pl.DataFrame, column: str) -> pl.DataFrame:
+        return df.select(get_phone_number_key(column).alias("Key")).drop_nulls().unique()
 
-        if not template_file_name:
-            sys.exit("The template file was not found")
+    @staticmethod
+    def _add_keys(df: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+        return df.with_columns(get_phone_number_key("tel").alias("Key"))
 
-        return template_file_name
+    @staticmethod
+    def _get_keys(df: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+        return df.select(get_phone_number_key("Number").alias("Key"))
 
     @staticmethod
-    def _check_if_file_has_data(file_name: str) -> bool:
-        try:
-            pl.read_excel(file_name, raise_if_empty=True)
-        except pl.exceptions.NoDataError:
-            return False
+    def _get_template_file_names(input_files: InputFiles) -> list[str]:
+        if not input_files.template_file_names:
+            sys.exit("The template file was not found")
 
-        return True
+        return input_files.template_file_names
 
     @staticmethod
-    def _get_source(file_name: str) -> str | None:
+    def _get_source(file_name: str) -> str:
         if "_GEN_" in file_name:
             return "GEN_OPER"
 
@@ -100,57 +144,143 @@ class SurveyStudioFileMaker:
         if "_ROBOGEN_TargetAI_" in file_name:
             return "GEN_TARGET"
 
-        sys.Exit("Source was not determined")
-
-    def _make_new_row(self, row: dict, source: str) -> dict:
-        return {
-            "Number": str(row["tel"]),
-            "RegionName": row["obl_name"],
-            "OperatorName": row["GrS_name"],
-            "TimeDifference": row["UTC_timediff"],
-            "Region": self._get_reg_code(row),
-            "Operator": str(row["GrS_code"]),
-            "CallIntervalBegin": "10:00:00",
-            "CallIntervalEnd": "22:00:00",
-            "Group": self._get_group(row),
-            "CHECK": self._get_check(row),
-            "Mark": self._get_mark(row),
-            "SOURCE": source,
-            "TimeZone": self._get_timezone(row),
-        }
+        raise TemplateError("Source was not determined")
 
-    @staticmethod
-    def _get_reg_code(row: dict) -> str:
-        region_id = int(row["obl_code"])
-        if region_id < 10:
-            return f"{region_id:0>2}"
-        else:
-            return str(region_id)
+    def _check_timezones(self, df: pl.DataFrame) -> None:
+        known_timezones = list(self.TIMEZONES.keys())
+        unknown_timezones = (
+            df.lazy()
+            .filter(pl.col("UTC_timediff").is_null() | ~pl.col("UTC_timediff").is_in(known_timezones))
+            .select(pl.col("UTC_timediff").unique())
+            .collect()
+            .get_column("UTC_timediff")
+            .to_list()
+        )
 
-    @staticmethod
-    def _get_group(row: dict) -> str:
-        return f"{row['obl_name']}_{row['GrS_name']}"
+        if unknown_timezones:
+            unknown_timezones_string = ", ".join(sorted(str(timezone) for timezone in unknown_timezones))
+            raise TemplateError(f"Unknown UTC_timediff values were found in the template: {unknown_timezones_string}")
+
+    def _skip_unknown_numbers(
+        self, numbers: pl.DataFrame | pl.LazyFrame, skipped_numbers: list[pl.DataFrame | pl.LazyFrame]
+    ) -> tuple[pl.DataFrame | pl.LazyFrame, int]:
+        is_enriched = pl.all_horizontal(pl.col(NumberingPlan.ENRICHED_COLUMNS).is_not_null())
+        skipped_numbers.append(self._make_skipped_rows(numbers.filter(~is_enriched), "numbering_plan"))
+
+        unknown_numbers_counter = numbers.lazy().select((~is_enriched).sum()).collect().item()
+        print(f"{unknown_numbers_counter} numbers were skipped because they were not found in the numbering plan")
+
+        numbers = numbers.filter(is_enriched)
+        self._check_timezones(numbers)
 
+        return numbers, unknown_numbers_counter
+
+    def _make_skipped_rows(
+        self, df: pl.DataFrame | pl.LazyFrame, reason: str | None = None
+    ) -> pl.DataFrame | pl.LazyFrame:
+        reason = pl.lit(reason) if reason is not None else pl.col("Reason")
+
+        return df.select(
+            self._as_str("tel"), pl.col("Key"), reason.cast(pl.String).cast(self.SKIP_REASONS).alias("Reason")
+        )
+
+    def _get_skip_audit_path(self, clean_file_name: str, first_sequence_number: int) -> str:
+        skip_audit_path = self.config.get("skip_audit_path", f"{self.config['results_path']}/skipped")
+        skip_audit_format = self.config.get("skip_audit_format", "parquet")
+        os.makedirs(skip_audit_path, exist_ok=True)
+
+        return f"{skip_audit_path}/{clean_file_name}_{first_sequence_number:0>3}_skipped.{skip_audit_format}"
+
+    # Every reason is a separate frame, they are concatenated and written in one go instead of being printed.
+    # Lazy frames are collected one by one, sinking their concatenation trips the common subplan elimination
+    def _write_skip_audit(self, skipped_numbers: list[pl.DataFrame | pl.LazyFrame], skip_audit_path: str) -> None:
+        skipped_numbers = pl.concat([df.lazy().collect() for df in skipped_numbers])
+
+        if skip_audit_path.endswith(".csv"):
+            skipped_numbers.write_csv(skip_audit_path)
+        else:
+            skipped_numbers.write_parquet(skip_audit_path)
+
+        print(f"Skipped numbers and their reasons were written to {skip_audit_path}")
+
+    def _make_new_rows(self, df: pl.DataFrame | pl.LazyFrame, source: str) -> pl.DataFrame | pl.LazyFrame:
+        return df.select(
+            self._as_str("tel").alias("Number"),
+            pl.col("obl_name").alias("RegionName"),
+            pl.col("GrS_name").alias("OperatorName"),
+            pl.col("UTC_timediff").alias("TimeDifference"),
+            self._get_reg_code().alias("Region"),
+            self._as_str("GrS_code").alias("Operator"),
+            pl.lit("10:00:00").alias("CallIntervalBegin"),
+            pl.lit("22:00:00").alias("CallIntervalEnd"),
+            self._get_group().alias("Group"),
+            self._get_check().alias("CHECK"),
+            self._get_mark().alias("Mark"),
+            pl.lit(source).alias("SOURCE"),
+            self._get_timezone().alias("TimeZone"),
+        )
+
+    # Mirrors str() for every value, including None
     @staticmethod
-    def _get_check(row: dict) -> str:
-        return str(row["tel"])[1:]
+    def _as_str(column: str) -> pl.Expr:
+        return pl.col(column).cast(pl.String).fill_null("None")
 
     @staticmethod
-    def _get_mark(row: dict) -> str:
-        return f"{row['obl_code']}_{row['GrS_code']}"
+    def _get_reg_code() -> pl.Expr:
+        return pl.col("obl_code").cast(pl.Int64).cast(pl.String).str.zfill(2)
 
-    def _get_timezone(self, row: dict) -> str:
-        timezone = row["UTC_timediff"]
+    def _get_group(self) -> pl.Expr:
+        return pl.concat_str(self._as_str("obl_name"), pl.lit("_"), self._as_str("GrS_name"))
 
-        return self.TIMEZONES[timezone]
+    def _get_check(self) -> pl.Expr:
+        return self._as_str("tel").str.slice(1)
 
-    def _get_output_file_name(self, template_file_name: str) -> str:
+    def _get_mark(self) -> pl.Expr:
+        return pl.concat_str(self._as_str("obl_code"), pl.lit("_"), self._as_str("GrS_code"))
+
+    def _get_timezone(self) -> pl.Expr:
+        return pl.col("UTC_timediff").replace_strict(self.TIMEZONES, return_dtype=pl.String)
+
+    @staticmethod
+    def _get_clean_file_name(template_file_name: str) -> str:
         file_name_without_temp = template_file_name.replace("_Temp", "").replace("_template", "")
-        clean_file_name = file_name_without_temp.split(".")[1].replace("/", "")
 
-        next_sequence_number = self._get_result_file_name_sequence_number(clean_file_name)
+        return file_name_without_temp.split(".")[1].replace("/", "")
+
+    def _get_first_sequence_number(self, ledger: ExportLedger, clean_file_name: str) -> int:
+        last_sequence_number = ledger.get_last_sequence_number(clean_file_name)
+
+        # Results exported before the ledger was introduced are only known by their file names
+        if last_sequence_number is None:
+            return int(self._get_result_file_name_sequence_number(clean_file_name))
+
+        return last_sequence_number + 1
+
+    # The ledger is locked only while these short steps run, files are written without holding it
+    def _reserve_batches(
+        self, template_file_name: str, clean_file_name: str, keys: pl.DataFrame
+    ) -> tuple[pl.DataFrame, int, list[int]]:
+        with self._ledger as ledger:
+            exported_numbers = ledger.find_exported_numbers(keys)
+            new_keys = keys.join(exported_numbers, on="Key", how="anti")
 
-        return f"{clean_file_name}_{next_sequence_number}.xlsx"
+            first_sequence_number = self._get_first_sequence_number(ledger, clean_file_name)
+            batch_ids = ledger.reserve_batches(
+                template_file_name, clean_file_name, first_sequence_number, self._get_shards_number(), new_keys
+            )
+
+        return exported_numbers, first_sequence_number, batch_ids
+
+    def _record_batches(self, batch_ids: list[int], shards_keys: list[pl.DataFrame]) -> None:
+        with self._ledger as ledger:
+            for batch_id, shard_keys in zip(batch_ids, shards_keys, strict=True):
+                ledger.record_batch(batch_id, shard_keys)
+
+    def _release_batches(self, batch_ids: list[int]) -> None:
+        with self._ledger as ledger:
+            ledger.release_batches(batch_ids)
+
+        print(f"{len(batch_ids)} reserved batches were released because their files were not written")
 
     def _get_result_file_name_sequence_number(self, file_name: str) -> str:
         sequence_numbers = []
@@ -164,57 +294,504 @@ class SurveyStudioFileMaker:
 
         return f"{max(sequence_numbers) + 1:0>3}"
 
-    def _write_dataframe_to_file(self, df: pl.DataFrame, template_file_name: str) -> None:
-        output_file_name = self._get_output_file_name(template_file_name)
-        output_path = f"{self.config['results_path']}/{output_file_name}"
+    def _get_output_path(self, clean_file_name: str, sequence_number: int) -> str:
+        return f"{self.config['results_path']}/{clean_file_name}_{sequence_number:0>3}.xlsx"
+
+    @staticmethod
+    def _write_dataframe_to_file(df: pl.DataFrame, output_path: str) -> None:
         df.write_excel(output_path)
         print(f"File {output_path} with {len(df)} records is ready")
 
+    def _get_shards_number(self) -> int:
+        return self.config.get("shards_number", 2)
+
+    def _get_shards_balance_columns(self) -> list[str]:
+        return self.config.get("shards_balance_columns", [])
+
+    def _make_shards(self, lf: pl.LazyFrame, rows_number: int) -> list[pl.LazyFrame]:
+        shards_number = self._get_shards_number()
+        balance_columns = self._get_shards_balance_columns()
+
+        # Every Group/TimeZone combination is dealt out to the shards in turn
+        if balance_columns:
+            shard_index = pl.int_range(pl.len()).over(balance_columns) % shards_number
+            return [lf.filter(shard_index == index) for index in range(shards_number)]
+
+        bounds = [int(rows_number * index / shards_number) for index in range(shards_number + 1)]
+
+        return [lf.slice(bounds[index], bounds[index + 1] - bounds[index]) for index in range(shards_number)]
+
+    @staticmethod
+    def _count_rows(lf: pl.LazyFrame) -> int:
+        return lf.select(pl.len()).collect().item()
+
+    # Column types are inferred from the whole CSV, a column that changes its type deep in the template would fail the
+    # streaming mode while loading fine in memory
+    @staticmethod
+    def _spool_template(template_file_name: str, spool_path: str) -> str:
+        csv_spool = f"{spool_path}/template.csv"
+        template_spool = f"{spool_path}/template.parquet"
+
+        Xlsx2csv(template_file_name, outputencoding="utf-8").convert(csv_spool)
+        pl.scan_csv(csv_spool, infer_schema_length=None).sink_parquet(template_spool)
+        os.remove(csv_spool)
+
+        return template_spool
+
+    @classmethod
+    def _write_shard_to_file(cls, shard: pl.LazyFrame, shard_spool: str, output_path: str) -> int:
+        shard.sink_parquet(shard_spool)
+        shard = pl.scan_parquet(shard_spool)
+        rows_number = cls._count_rows(shard)
+
+        workbook = xlsxwriter.Workbook(output_path, {"constant_memory": True})
+        worksheet = workbook.add_worksheet()
+        worksheet.write_row(0, 0, shard.collect_schema().names())
+
+        for offset in range(0, rows_number, cls.EXCEL_CHUNK_SIZE):
+            chunk = shard.slice(offset, cls.EXCEL_CHUNK_SIZE).collect()
+            for row_index, row in enumerate(chunk.iter_rows(), start=offset + 1):
+                worksheet.write_row(row_index, 0, row)
+
+        workbook.close()
+
+        return rows_number
+
     @staticmethod
     def _clean_template_file(template_file_name: str) -> None:
         df = pl.DataFrame([])
         df.write_excel(template_file_name)
 
-    def run(self):
-        checklist = self._make_checklist()
-        blacklist = self._make_blacklist()
+    @staticmethod
+    def _read_template(template_file_name: str) -> pl.DataFrame:
+        return pl.read_excel(template_file_name)
+
+    def _run_in_memory(
+        self, template_file_name: str, source: str, excluded_numbers: pl.DataFrame, template: pl.DataFrame | None
+    ) -> tuple[pl.DataFrame, dict]:
+        self._phase_timer.start("load")
+        df = template if template is not None else self._read_template(template_file_name)
+        template_rows_number = len(df)
+        print(f"A raw file {template_file_name} with {template_rows_number} records was opened")
+
+        self._phase_timer.start("exclude")
+        if self._numbering_plan is None:
+            self._check_timezones(df)
+
+        numbers = self._add_keys(df)
+        skipped_numbers = [self._make_skipped_rows(numbers.filter(pl.col("Key").is_null()), "invalid")]
+
+        invalid_numbers_counter = numbers.get_column("Key").null_count()
+        print(f"{invalid_numbers_counter} numbers were skipped because they are not valid phone numbers")
+
+        numbers = numbers.drop_nulls("Key")
+        if self._numbering_plan is not None:
+            numbers, _ = self._skip_unknown_numbers(self._numbering_plan.enrich(numbers), skipped_numbers)
+
+        skipped_numbers.append(self._make_skipped_rows(numbers.filter(~pl.col("Key").is_first_distinct()), "duplicate"))
+        unique_numbers = numbers.unique("Key", keep="first", maintain_order=True)
+        print(f"{len(numbers) - len(unique_numbers)} numbers were skipped because they are repeated in the template")
+        numbers = unique_numbers
+
+        # A number found in both lists is listed with both reasons
+        skipped_numbers.append(
+            self._make_skipped_rows(numbers.join(excluded_numbers, on="Key", how="inner", maintain_order="left"))
+        )
+
+        not_excluded_numbers = numbers.join(excluded_numbers, on="Key", how="anti", maintain_order="left")
+        print(
+            f"{len(numbers) - len(not_excluded_numbers)} numbers were skipped "
+            "because they were found either in checklist or in blacklist"
+        )
+        numbers = not_excluded_numbers
+
+        clean_file_name = self._get_clean_file_name(template_file_name)
+        exported_numbers, first_sequence_number, batch_ids = self._reserve_batches(
+            template_file_name, clean_file_name, numbers.select("Key")
+        )
+        print(f"{len(exported_numbers)} numbers were skipped because they were exported in earlier batches")
+
+        skipped_numbers.append(
+            self._make_skipped_rows(
+                numbers.join(exported_numbers, on="Key", how="semi", maintain_order="left"), "exported"
+            )
+        )
+        numbers = numbers.join(exported_numbers, on="Key", how="anti", maintain_order="left")
 
-        template_file_name = self._find_template_file_name()
+        try:
+            self._phase_timer.start("transform")
+            df = self._make_new_rows(numbers, source)
+            print(f"A new dataframe with {len(df)} records was formed")
+
+            self._phase_timer.start("write")
+            output_paths = []
+            shards_keys = []
+
+            for index, shard in enumerate(self._make_shards(df.lazy(), len(df))):
+                shard = shard.collect()
+                output_path = self._get_output_path(clean_file_name, first_sequence_number + index)
+
+                self._write_dataframe_to_file(shard, output_path)
+                shards_keys.append(self._get_keys(shard))
+                output_paths.append(output_path)
+
+            self._record_batches(batch_ids, shards_keys)
+
+        except BaseException:
+            self._release_batches(batch_ids)
+            raise
+
+        self._write_skip_audit(skipped_numbers, self._get_skip_audit_path(clean_file_name, first_sequence_number))
+
+        summary = {"Records": template_rows_number, "Exported": len(df), "Files": output_paths}
+
+        return numbers.select("Key"), summary
+
+    def _run_streaming(
+        self, template_file_name: str, source: str, excluded_numbers: pl.DataFrame
+    ) -> tuple[pl.DataFrame, dict]:
+        with TemporaryDirectory() as spool_path:
+            self._phase_timer.start("load")
+            template = pl.scan_parquet(self._spool_template(template_file_name, spool_path))
+            template_rows_number = self._count_rows(template)
+            print(f"A raw file {template_file_name} with {template_rows_number} records was spooled")
+
+            self._phase_timer.start("exclude")
+            if self._numbering_plan is None:
+                self._check_timezones(template)
+
+            numbers = self._add_keys(template)
+            skipped_numbers = [self._make_skipped_rows(numbers.filter(pl.col("Key").is_null()), "invalid")]
+
+            invalid_numbers_counter = self._count_rows(numbers.filter(pl.col("Key").is_null()))
+            print(f"{invalid_numbers_counter} numbers were skipped because they are not valid phone numbers")
+
+            numbers = numbers.drop_nulls("Key")
+            unknown_numbers_counter = 0
+
+            # The range lookup sorts the whole template, so its result is spooled once instead of being recomputed
+            if self._numbering_plan is not None:
+                enriched_spool = f"{spool_path}/enriched.parquet"
+                self._numbering_plan.enrich(numbers).sink_parquet(enriched_spool)
+                numbers, unknown_numbers_counter = self._skip_unknown_numbers(
+                    pl.scan_parquet(enriched_spool), skipped_numbers
+                )
+
+            skipped_numbers.append(
+                self._make_skipped_rows(numbers.filter(~pl.col("Key").is_first_distinct()), "duplicate")
+            )
+            numbers = numbers.unique("Key", keep="first", maintain_order=True)
+            unique_numbers_counter = self._count_rows(numbers)
+            repeated_numbers_counter = (
+                template_rows_number - invalid_numbers_counter - unknown_numbers_counter - unique_numbers_counter
+            )
+            print(f"{repeated_numbers_counter} numbers were skipped because they are repeated in the template")
+
+            skipped_numbers.append(
+                self._make_skipped_rows(
+                    numbers.join(excluded_numbers.lazy(), on="Key", how="inner", maintain_order="left")
+                )
+            )
+            numbers = numbers.join(excluded_numbers.lazy(), on="Key", how="anti", maintain_order="left")
+            keys = numbers.select("Key").collect()
+
+            skipped_counter = unique_numbers_counter - len(keys)
+            print(f"{skipped_counter} numbers were skipped because they were found either in checklist or in blacklist")
+
+            clean_file_name = self._get_clean_file_name(template_file_name)
+            exported_numbers, first_sequence_number, batch_ids = self._reserve_batches(
+                template_file_name, clean_file_name, keys
+            )
+            print(f"{len(exported_numbers)} numbers were skipped because they were exported in earlier batches")
+
+            skipped_numbers.append(
+                self._make_skipped_rows(
+                    numbers.join(exported_numbers.lazy(), on="Key", how="semi", maintain_order="left"), "exported"
+                )
+            )
+            numbers = numbers.join(exported_numbers.lazy(), on="Key", how="anti", maintain_order="left")
+
+            try:
+                self._phase_timer.start("transform")
+                result_spool = f"{spool_path}/result.parquet"
+                self._make_new_rows(numbers, source).sink_parquet(result_spool)
+                result = pl.scan_parquet(result_spool)
+                rows_number = self._count_rows(result)
+                print(f"A new dataframe with {rows_number} records was formed")
+
+                self._phase_timer.start("write")
+                shards = self._make_shards(result, rows_number)
+                max_workers = min(len(shards), os.cpu_count() or 1)
+                output_paths = []
+                shards_keys = []
+
+                with ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context("spawn")) as executor:
+                    futures = []
+                    for index, shard in enumerate(shards):
+                        output_path = self._get_output_path(clean_file_name, first_sequence_number + index)
+                        shard_spool = f"{spool_path}/shard_{index}.parquet"
+                        future = executor.submit(self._write_shard_to_file, shard, shard_spool, output_path)
+                        futures.append((output_path, shard_spool, future))
+
+                    for output_path, shard_spool, future in futures:
+                        print(f"File {output_path} with {future.result()} records is ready")
+
+                        shards_keys.append(self._get_keys(pl.scan_parquet(shard_spool)).collect())
+                        output_paths.append(output_path)
+
+                self._record_batches(batch_ids, shards_keys)
+
+            except BaseException:
+                self._release_batches(batch_ids)
+                raise
+
+            self._write_skip_audit(skipped_numbers, self._get_skip_audit_path(clean_file_name, first_sequence_number))
+
+            summary = {
+                "Records": template_rows_number,
+                "Exported": rows_number,
+                "Files": output_paths,
+            }
+
+            return self._get_keys(result).collect(), summary
+
+    # The reason column tells the skip audit which list a number was found in
+    def _combine_excluded_numbers(self, checklist: pl.DataFrame, blacklist: pl.DataFrame) -> pl.DataFrame:
+        return pl.concat(
+            [
+                checklist.with_columns(pl.lit("checklist", dtype=self.SKIP_REASONS).alias("Reason")),
+                blacklist.with_columns(pl.lit("blacklist", dtype=self.SKIP_REASONS).alias("Reason")),
+            ],
+            rechunk=False,
+        )
+
+    def _read_excluded_numbers(self) -> pl.DataFrame:
+        return self._combine_excluded_numbers(self._checklist_cache.read(), self._blacklist_cache.read())
+
+    def _process_template(
+        self, template_file_name: str, excluded_numbers: pl.DataFrame, template: pl.DataFrame | None = None
+    ) -> tuple[pl.DataFrame, dict]:
+        started_at = perf_counter()
+        phases_snapshot = dict(self._phase_timer.seconds)
         source = self._get_source(template_file_name)
 
-        df = pl.read_excel(template_file_name)
-        print(f"A raw file {template_file_name} with {len(df)} records was opened")
+        if self.config.get("streaming", False):
+            exported_numbers, summary = self._run_streaming(template_file_name, source, excluded_numbers)
+        else:
+            exported_numbers, summary = self._run_in_memory(template_file_name, source, excluded_numbers, template)
+
+        self._phase_timer.stop()
+        self._clean_template_file(template_file_name)
+        print(f"A raw file {template_file_name} was cleared")
+
+        summary = {"Template": template_file_name, "Source": source, **summary}
+        summary["Seconds"] = round(perf_counter() - started_at, 2)
+        summary["Phases"] = self._phase_timer.get_seconds_since(phases_snapshot)
+
+        return exported_numbers, summary
+
+    @classmethod
+    def _process_template_in_worker(cls, template_file_name: str) -> tuple[pl.DataFrame, dict]:
+        maker = cls()
+
+        return maker._process_template(template_file_name, maker._read_excluded_numbers())
+
+    def _get_batch_workers_number(self, templates_number: int) -> int:
+        return min(templates_number, self.config.get("batch_workers", os.cpu_count() or 1))
+
+    # Every file is parsed on its own thread, how long each of them took is printed along with the total
+    @staticmethod
+    def _load_inputs(loaders: dict[str, Callable[[], Any]]) -> dict[str, Any]:
+        started_at = perf_counter()
+        inputs = {}
+
+        for file_name, (result, seconds) in load_concurrently(loaders).items():
+            inputs[file_name] = result
+            print(f"{file_name} was loaded in {seconds:.2f} seconds")
+
+        print(f"All inputs were loaded in {perf_counter() - started_at:.2f} seconds")
+
+        return inputs
+
+    def run(self):
+        input_files = self._discover_input_files()
+        template_file_name = self._get_template_file_names(input_files)[-1]
+
+        loaders = {
+            input_files.checklist_file_name: partial(self._make_checklist, input_files.checklist_file_name),
+            input_files.blacklist_file_name: partial(self._make_blacklist, input_files.blacklist_file_name),
+        }
+
+        # The streaming mode spools the template by itself
+        if not self.config.get("streaming", False):
+            loaders[template_file_name] = partial(self._read_template, template_file_name)
+
+        self._phase_timer.start("load")
+        inputs = self._load_inputs(loaders)
+        checklist = inputs[input_files.checklist_file_name]
+        blacklist = inputs[input_files.blacklist_file_name]
+        excluded_numbers = self._combine_excluded_numbers(checklist, blacklist)
 
-        skipped_counter = 0
-        new_rows = []
-        for row in df.iter_rows(named=True):
-            number = str(row["tel"])
+        try:
+            exported_numbers, _ = self._process_template(
+                template_file_name, excluded_numbers, inputs.get(template_file_name)
+            )
+        except TemplateError as e:
+            sys.exit(str(e))
+
+        if self.config.get("append_exported_to_checklist", False):
+            self._checklist_cache.append(exported_numbers)
+
+    # Exclusion indexes are built once here, workers memory-map the same cache files read-only. Summaries of the
+    # templates are returned as well as printed
+    def run_batch(self) -> list[dict]:
+        input_files = self._discover_input_files()
+        template_file_names = self._get_template_file_names(input_files)
+        print(f"{len(template_file_names)} template files were found")
+
+        # Parsing the exclusion workbooks is timed in the load phase of this process, the workers only read the indexes
+        self._phase_timer.start("load")
+        self._make_checklist(input_files.checklist_file_name)
+        self._make_blacklist(input_files.blacklist_file_name)
+        self._phase_timer.stop()
+
+        workers_number = self._get_batch_workers_number(len(template_file_names))
+        summaries = []
+        exported_numbers = []
+
+        with ProcessPoolExecutor(max_workers=workers_number, mp_context=get_context("spawn")) as executor:
+            futures = {
+                file_name: executor.submit(self._process_template_in_worker, file_name)
+                for file_name in template_file_names
+            }
+
+            for file_name, future in futures.items():
+                try:
+                    template_exported_numbers, summary = future.result()
+                except self.TEMPLATE_ERRORS as e:
+                    summary = {"Template": file_name, "Error": str(e)}
+                    print(f"The template {file_name} was not processed: {e}")
+                else:
+                    exported_numbers.append(template_exported_numbers)
+
+                summaries.append(summary)
+
+        if exported_numbers and self.config.get("append_exported_to_checklist", False):
+            self._checklist_cache.append(pl.concat(exported_numbers))
+
+        summary = pl.DataFrame(
+            [
+                {column: summary.get(column) for column in self.BATCH_SUMMARY_COLUMNS}
+                | {"Files": ", ".join(summary.get("Files", []))}
+                for summary in summaries
+            ]
+        )
+
+        with pl.Config(tbl_rows=-1, tbl_cols=-1, tbl_width_chars=1000, fmt_str_lengths=1000):
+            print(summary)
+
+        return summaries
+
+    @staticmethod
+    def _get_files_state(file_names: list[str]) -> dict[str, tuple[int, int]]:
+        files_state = {}
 
-            if number in checklist or number in blacklist:
-                print(f"Number {number} was found either in checklist or in blacklist")
-                skipped_counter += 1
+        for file_name in file_names:
+            try:
+                stat = os.stat(file_name)
+            except FileNotFoundError:
                 continue
 
-            new_row = self._make_new_row(row, source)
-            new_rows.append(new_row)
+            files_state[file_name] = (stat.st_size, stat.st_mtime_ns)
 
-        print(f"{skipped_counter} numbers were skipped because they were found either in checklist or in blacklist")
+        return files_state
 
-        df = pl.DataFrame(new_rows)
-        print(f"A new dataframe with {len(df)} records was formed")
+    def _get_hot_excluded_numbers(self, input_files: InputFiles) -> pl.DataFrame:
+        exclusion_files_state = self._get_files_state(
+            [input_files.checklist_file_name, input_files.blacklist_file_name]
+        )
 
-        split_point = int(len(df) / 2)
+        if exclusion_files_state != self._exclusion_files_state:
+            checklist = self._make_checklist(input_files.checklist_file_name)
+            blacklist = self._make_blacklist(input_files.blacklist_file_name)
 
-        df1 = df.slice(0, split_point)
-        self._write_dataframe_to_file(df1, template_file_name)
+            self._excluded_numbers = self._combine_excluded_numbers(checklist, blacklist)
+            self._exclusion_files_state = exclusion_files_state
 
-        df2 = df.slice(split_point)
-        self._write_dataframe_to_file(df2, template_file_name)
+        return self._excluded_numbers
 
-        self._clean_template_file(template_file_name)
-        print(f"A raw file {template_file_name} was cleared")
+    # A template is picked up once it has not been modified for WATCH_SETTLE_SECONDS, so half-copied files are skipped
+    def _find_changed_templates(
+        self, templates_state: dict[str, tuple[int, int]], input_files: InputFiles
+    ) -> list[str]:
+        changed_templates = []
+        settled_before = time() - self.config.get("watch_settle_seconds", self.WATCH_SETTLE_SECONDS)
+
+        for file_name, file_state in self._get_files_state(input_files.template_file_names).items():
+            if templates_state.get(file_name) == file_state:
+                continue
+
+            if file_state[1] / 1_000_000_000 > settled_before:
+                continue
+
+            templates_state[file_name] = file_state
+            changed_templates.append(file_name)
+
+        return changed_templates
+
+    # Exclusion indexes stay in memory between templates and are reloaded only when their workbooks change
+    def watch(self) -> None:
+        watch_interval = self.config.get("watch_interval", self.WATCH_INTERVAL)
+        templates_state = {}
+        missing_file_message = None
+        self._exclusion_files_state = None
+
+        print(f"Watching {self.config['templates_path']} for new templates every {watch_interval} seconds...")
+
+        try:
+            while True:
+                # A missing checklist or blacklist is reported once, watching goes on until it appears
+                try:
+                    input_files = self._discovery.discover()
+                except InputFileNotFoundError as e:
+                    if str(e) != missing_file_message:
+                        missing_file_message = str(e)
+                        print(f"{e}, waiting for it")
+
+                    sleep(watch_interval)
+                    continue
+
+                missing_file_message = None
+
+                for template_file_name in self._find_changed_templates(templates_state, input_files):
+                    try:
+                        exported_numbers, summary = self._process_template(
+                            template_file_name, self._get_hot_excluded_numbers(input_files)
+                        )
+                    except self.TEMPLATE_ERRORS as e:
+                        print(f"The template {template_file_name} was not processed: {e}")
+                        continue
+
+                    print(f"The template {template_file_name} was processed in {summary['Seconds']} seconds")
+
+                    if self.config.get("append_exported_to_checklist", False):
+                        self._checklist_cache.append(exported_numbers)
+                        self._exclusion_files_state = None
+
+                    templates_state.update(self._get_files_state([template_file_name]))
+
+                sleep(watch_interval)
+
+        except KeyboardInterrupt:
+            print("Watching has been stopped")
 
 
 if __name__ == "__main__":
     maker = SurveyStudioFileMaker()
-    maker.run()
+
+    if "--batch" in sys.argv:
+        maker.run_batch()
+    elif "--watch" in sys.argv:
+        maker.watch()
+    else:
+        maker.run()
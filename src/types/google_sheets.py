@@ -1,4 +1,6 @@
 from dataclasses import dataclass
+from numbers import Number
+from typing import Any
 
 
 @dataclass
@@ -40,3 +42,82 @@ class RepeatCellRequest:
         fields_string = f"userEnteredFormat({fields})"
 
         return fields_string
+
+
+@dataclass
+class AppendCellsRequest:
+    sheet_id: int
+    rows: list[list[Any]]
+    format: dict
+
+    def to_dict(self) -> dict:
+        return {
+            "appendCells": {
+                "sheetId": self.sheet_id,
+                "rows": [{"values": [self.get_cell_data(value) for value in row]} for row in self.rows],
+                "fields": self.get_fields_string(),
+            }
+        }
+
+    def get_cell_data(self, value: Any) -> dict:
+        return {
+            "userEnteredValue": self.get_value_dict(value),
+            "userEnteredFormat": self.format,
+        }
+
+    # Values are entered as is like with the RAW input option, numpy numbers are converted to plain ones
+    @staticmethod
+    def get_value_dict(value: Any) -> dict:
+        if isinstance(value, bool):
+            return {"boolValue": value}
+
+        if isinstance(value, Number):
+            return {"numberValue": float(value)}
+
+        return {"stringValue": str(value)}
+
+    def get_fields_string(self) -> str:
+        fields = ", ".join(self.format.keys())
+        fields_string = f"userEnteredValue, userEnteredFormat({fields})"
+
+        return fields_string
+
+
+# Developer metadata is not shown in the sheet, it tags a row and is deleted together with it
+@dataclass
+class RowMetadataRequest:
+    sheet_id: int
+    row_index: int
+    key: str
+    value: str
+
+    def to_dict(self) -> dict:
+        return {
+            "createDeveloperMetadata": {
+                "developerMetadata": {
+                    "metadataKey": self.key,
+                    "metadataValue": self.value,
+                    "location": {
+                        "dimensionRange": {
+                            "sheetId": self.sheet_id,
+                            "dimension": "ROWS",
+                            "startIndex": self.row_index,
+                            "endIndex": self.row_index + 1,
+                        }
+                    },
+                    "visibility": "DOCUMENT",
+                }
+            }
+        }
+
+
+@dataclass
+class SheetState:
+    sheet_id: int
+    rows_number: int
+    keys: set[tuple[str, str]]
+
+    # Keeps the snapshot in sync after an append, so the sheet is not read again
+    def add_row(self, key: tuple[str, str]) -> None:
+        self.rows_number += 1
+        self.keys.add(key)
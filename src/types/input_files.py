@@ -0,0 +1,14 @@
+from dataclasses import dataclass, field
+
+
+@dataclass
+class ExcelFileProbe:
+    columns: list[str]
+    has_data: bool
+
+
+@dataclass
+class InputFiles:
+    checklist_file_name: str = ""
+    blacklist_file_name: str = ""
+    template_file_names: list[str] = field(default_factory=list)
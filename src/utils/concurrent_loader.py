@@ -0,0 +1,20 @@
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Any
+
+
+def _load_timed(loader: Callable[[], Any]) -> tuple[Any, float]:
+    started_at = perf_counter()
+    result = loader()
+
+    return result, perf_counter() - started_at
+
+
+# Runs every loader on its own thread and waits for all of them, calamine releases the GIL while parsing. Every result
+# comes with the seconds its loader took
+def load_concurrently(loaders: dict[str, Callable[[], Any]]) -> dict[str, tuple[Any, float]]:
+    with ThreadPoolExecutor(max_workers=len(loaders)) as executor:
+        futures = {name: executor.submit(_load_timed, loader) for name, loader in loaders.items()}
+
+        return {name: future.result() for name, future in futures.items()}
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+from time import time
+
+import requests
+from bs4 import BeautifulSoup
+from survey_studio_clients.web_scrapers.daily_counters import DailyCountersPageScraper
+
+
+class DailyCountersCache:
+    TTL_SECONDS = 3600
+    REQUEST_TIMEOUT_SECONDS = 60
+
+    # Every link gets its own file in the cache folder, so the pages of several projects do not replace each other
+    def __init__(self, link: str | None, cache_folder: str | None = None, ttl_seconds: int = TTL_SECONDS) -> None:
+        self._link = link
+        self._cache_file_name = (
+            None if cache_folder is None else os.path.join(cache_folder, f"{self._get_link_hash()}.json")
+        )
+        self._ttl_seconds = ttl_seconds
+
+        self._scraper: DailyCountersPageScraper | None = None
+        self._is_page_loaded = False
+        self._counters = self._read_counters()
+
+    # The page is fetched once per run and every counter on it goes to the table, within the TTL it is not fetched at
+    # all. Only a counter the table does not have is left to the scraper
+    def get_value_by_counter_name(self, counter_name: str) -> int:
+        if counter_name not in self._counters and not self._is_page_loaded:
+            self._load_page(counter_name)
+
+        if counter_name in self._counters:
+            value, _ = self._counters[counter_name]
+
+            return value
+
+        print(f"The counter {counter_name} was not found in the counters table, it is scraped")
+
+        value = self._scrape(counter_name)
+        self._counters[counter_name] = value, time()
+        self._write_counters()
+
+        return value
+
+    def _scrape(self, counter_name: str) -> int:
+        if self._scraper is None:
+            self._scraper = DailyCountersPageScraper(self._link)
+
+        return self._scraper.get_value_by_counter_name(counter_name)
+
+    # The table layout is guessed, so one of its values is checked against the scraper before the table is trusted. A
+    # table that disagrees is dropped and every counter is scraped
+    def _load_page(self, counter_name: str) -> None:
+        self._is_page_loaded = True
+
+        response = requests.get(self._link, timeout=self.REQUEST_TIMEOUT_SECONDS)
+        response.raise_for_status()
+
+        counters = self._parse_counters(response.content)
+        print(f"The counters page was loaded, {len(counters)} counters were found")
+
+        if counters:
+            checked_counter_name = counter_name if counter_name in counters else next(iter(counters))
+            scraped_value = self._scrape(checked_counter_name)
+
+            if counters[checked_counter_name] != scraped_value:
+                print(
+                    f"The counters table gives {counters[checked_counter_name]} for {checked_counter_name}, the "
+                    f"scraper gives {scraped_value}, the table is not used"
+                )
+                counters = {checked_counter_name: scraped_value}
+
+        fetched_at = time()
+        self._counters.update({name: (value, fetched_at) for name, value in counters.items()})
+        self._write_counters()
+
+    # A row of the counters table starts with the counter name, e.g. "1 декабря", and goes on with its value. The page
+    # is parsed from bytes, BeautifulSoup finds its encoding better than the HTTP headers tell it
+    @staticmethod
+    def _parse_counters(html: bytes) -> dict[str, int]:
+        counters = {}
+
+        for row in BeautifulSoup(html, "html.parser").find_all("tr"):
+            cells = [cell.get_text(" ", strip=True) for cell in row.find_all(["td", "th"])]
+            values = [cell.replace(" ", "").replace("\xa0", "") for cell in cells[1:]]
+            value = next((value for value in values if value.isdigit()), None)
+
+            if cells and cells[0] and value is not None:
+                counters[cells[0]] = int(value)
+
+        return counters
+
+    # The link is stored as a hash, it may contain an access token
+    def _get_link_hash(self) -> str:
+        return hashlib.sha256((self._link or "").encode()).hexdigest()
+
+    def _read_counters(self) -> dict[str, tuple[int, float]]:
+        if self._cache_file_name is None or not os.path.exists(self._cache_file_name):
+            return {}
+
+        with open(self._cache_file_name, "r") as ifile:
+            cache = json.load(ifile)
+
+        if cache.get("link_hash") != self._get_link_hash():
+            return {}
+
+        expires_after = time() - self._ttl_seconds
+
+        return {
+            counter_name: (value, fetched_at)
+            for counter_name, (value, fetched_at) in cache.get("counters", {}).items()
+            if fetched_at > expires_after
+        }
+
+    def _write_counters(self) -> None:
+        if self._cache_file_name is None:
+            return
+
+        os.makedirs(os.path.dirname(self._cache_file_name) or ".", exist_ok=True)
+        cache = {
+            "link_hash": self._get_link_hash(),
+            "counters": {counter_name: list(counter) for counter_name, counter in self._counters.items()},
+        }
+        temporary_path = f"{self._cache_file_name}.tmp"
+
+        with open(temporary_path, "w") as ofile:
+            json.dump(cache, ofile, ensure_ascii=False, indent=4)
+
+        os.replace(temporary_path, self._cache_file_name)
@@ -0,0 +1,121 @@
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+import polars as pl
+
+from src.types.input_files import ExcelFileProbe
+
+SPREADSHEET_NAMESPACE = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+RELATIONSHIPS_NAMESPACE = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PACKAGE_RELATIONSHIPS_NAMESPACE = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+# Reads only the workbook index and the first two non-empty rows of a sheet, the cell data is never parsed
+def probe_excel_file(file_name: str, sheet_name: str | None = None) -> ExcelFileProbe:
+    if not zipfile.is_zipfile(file_name):
+        return _probe_by_reading(file_name, sheet_name)
+
+    with zipfile.ZipFile(file_name) as archive:
+        sheet_path = _get_sheet_path(archive, sheet_name)
+        if sheet_path is None:
+            return ExcelFileProbe(columns=[], has_data=False)
+
+        header, has_data = _read_first_rows(archive, sheet_path)
+        columns = _resolve_cells(archive, header)
+
+    return ExcelFileProbe(columns=columns, has_data=has_data)
+
+
+# Legacy .xls workbooks are not zip archives, so they are probed through a regular read
+def _probe_by_reading(file_name: str, sheet_name: str | None) -> ExcelFileProbe:
+    try:
+        df = pl.read_excel(file_name, sheet_name=sheet_name, raise_if_empty=True)
+    except pl.exceptions.NoDataError:
+        return ExcelFileProbe(columns=[], has_data=False)
+
+    return ExcelFileProbe(columns=df.columns, has_data=not df.is_empty())
+
+
+def _get_sheet_path(archive: zipfile.ZipFile, sheet_name: str | None) -> str | None:
+    with archive.open("xl/workbook.xml") as ifile:
+        sheets = [
+            (element.get("name"), element.get(f"{RELATIONSHIPS_NAMESPACE}id"))
+            for _, element in iterparse(ifile)
+            if element.tag == f"{SPREADSHEET_NAMESPACE}sheet"
+        ]
+
+    relationship_ids = [relationship_id for name, relationship_id in sheets if sheet_name in (None, name)]
+    if not relationship_ids:
+        return None
+
+    with archive.open("xl/_rels/workbook.xml.rels") as ifile:
+        for _, element in iterparse(ifile):
+            if (
+                element.tag == f"{PACKAGE_RELATIONSHIPS_NAMESPACE}Relationship"
+                and element.get("Id") == relationship_ids[0]
+            ):
+                target = element.get("Target")
+                return target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+
+    return None
+
+
+def _read_first_rows(archive: zipfile.ZipFile, sheet_path: str) -> tuple[list[tuple[str, str]], bool]:
+    header = []
+
+    with archive.open(sheet_path) as ifile:
+        for _, element in iterparse(ifile):
+            if element.tag != f"{SPREADSHEET_NAMESPACE}row":
+                continue
+
+            cells = [_read_cell(cell) for cell in element.iter(f"{SPREADSHEET_NAMESPACE}c")]
+            cells = [cell for cell in cells if cell[1]]
+            element.clear()
+
+            if not cells:
+                continue
+
+            if header:
+                return header, True
+
+            header = cells
+
+    return header, False
+
+
+def _read_cell(cell) -> tuple[str, str]:
+    cell_type = cell.get("t", "n")
+
+    if cell_type == "inlineStr":
+        return cell_type, "".join(text.text or "" for text in cell.iter(f"{SPREADSHEET_NAMESPACE}t"))
+
+    value = cell.find(f"{SPREADSHEET_NAMESPACE}v")
+
+    return cell_type, value.text if value is not None and value.text is not None else ""
+
+
+# Shared strings are streamed only up to the last index used by the header row
+def _resolve_cells(archive: zipfile.ZipFile, cells: list[tuple[str, str]]) -> list[str]:
+    shared_string_indexes = {int(value) for cell_type, value in cells if cell_type == "s"}
+    shared_strings = {}
+
+    if shared_string_indexes and "xl/sharedStrings.xml" in archive.namelist():
+        last_index = max(shared_string_indexes)
+
+        with archive.open("xl/sharedStrings.xml") as ifile:
+            index = 0
+            for _, element in iterparse(ifile):
+                if element.tag != f"{SPREADSHEET_NAMESPACE}si":
+                    continue
+
+                if index in shared_string_indexes:
+                    shared_strings[index] = "".join(
+                        text.text or "" for text in element.iter(f"{SPREADSHEET_NAMESPACE}t")
+                    )
+
+                element.clear()
+                index += 1
+                if index > last_index:
+                    break
+
+    return [shared_strings.get(int(value), "") if cell_type == "s" else value for cell_type, value in cells]
@@ -0,0 +1,141 @@
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Self
+
+import polars as pl
+
+
+class ExportLedger:
+    LOCK_TIMEOUT = 600
+    INSERT_CHUNK_SIZE = 100_000
+    RESERVATION_TIMEOUT = timedelta(days=1)
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._connection = None
+
+        with self:
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS batches (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    template TEXT NOT NULL,
+                    file_name TEXT NOT NULL,
+                    sequence_number INTEGER NOT NULL,
+                    rows_number INTEGER NOT NULL,
+                    created_at TEXT NOT NULL,
+                    UNIQUE (file_name, sequence_number)
+                )
+                """
+            )
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS exported_numbers (
+                    key INTEGER PRIMARY KEY,
+                    batch_id INTEGER NOT NULL REFERENCES batches (id)
+                ) WITHOUT ROWID
+                """
+            )
+
+            # Ledgers created before reservations have only exported batches
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(batches)")]
+            if "status" not in columns:
+                self._connection.execute("ALTER TABLE batches ADD COLUMN status TEXT NOT NULL DEFAULT 'exported'")
+
+    # The ledger is locked for writing until the block exits, blocks are kept short so concurrent runs only wait for
+    # each other's bookkeeping, never for each other's files
+    def __enter__(self) -> Self:
+        self._connection = sqlite3.connect(self._path, timeout=self.LOCK_TIMEOUT, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("BEGIN IMMEDIATE")
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            if exc_type is None:
+                self._connection.execute("COMMIT")
+            else:
+                self._connection.execute("ROLLBACK")
+        finally:
+            self._connection.close()
+            self._connection = None
+
+    def find_exported_numbers(self, keys: pl.DataFrame) -> pl.DataFrame:
+        self._connection.execute("CREATE TEMP TABLE IF NOT EXISTS candidates (key INTEGER PRIMARY KEY) WITHOUT ROWID")
+        self._connection.execute("DELETE FROM candidates")
+        self._insert_keys("INSERT OR IGNORE INTO candidates (key) VALUES (?)", keys.get_column("Key"))
+
+        cursor = self._connection.execute(
+            "SELECT candidates.key FROM candidates JOIN exported_numbers ON exported_numbers.key = candidates.key"
+        )
+        exported_keys = [row[0] for row in cursor]
+
+        return pl.DataFrame({"Key": exported_keys}, schema={"Key": pl.Int64})
+
+    def get_last_sequence_number(self, file_name: str) -> int | None:
+        cursor = self._connection.execute("SELECT MAX(sequence_number) FROM batches WHERE file_name = ?", (file_name,))
+
+        return cursor.fetchone()[0]
+
+    # Sequence numbers and keys are taken before the files are written, so a concurrent run neither reuses the numbers
+    # nor exports the same keys. All keys are held by the first batch until the files are recorded
+    def reserve_batches(
+        self, template: str, file_name: str, first_sequence_number: int, batches_number: int, keys: pl.DataFrame
+    ) -> list[int]:
+        self._release_stale_reservations()
+
+        batch_ids = []
+        for sequence_number in range(first_sequence_number, first_sequence_number + batches_number):
+            cursor = self._connection.execute(
+                """
+                INSERT INTO batches (template, file_name, sequence_number, rows_number, created_at, status)
+                VALUES (?, ?, ?, 0, ?, 'reserved')
+                """,
+                (template, file_name, sequence_number, datetime.now().isoformat()),
+            )
+            batch_ids.append(cursor.lastrowid)
+
+        self._insert_keys(
+            "INSERT INTO exported_numbers (key, batch_id) VALUES (?, ?)", keys.get_column("Key"), batch_ids[0]
+        )
+
+        return batch_ids
+
+    def record_batch(self, batch_id: int, keys: pl.DataFrame) -> None:
+        self._connection.execute(
+            "UPDATE batches SET rows_number = ?, status = 'exported' WHERE id = ?", (len(keys), batch_id)
+        )
+
+        self._insert_keys(
+            """
+            INSERT INTO exported_numbers (key, batch_id) VALUES (?, ?)
+            ON CONFLICT (key) DO UPDATE SET batch_id = excluded.batch_id
+            """,
+            keys.get_column("Key"),
+            batch_id,
+        )
+
+    # Called when the files of a reservation could not be written, its keys can be exported again
+    def release_batches(self, batch_ids: list[int]) -> None:
+        placeholders = ", ".join("?" * len(batch_ids))
+
+        self._connection.execute(f"DELETE FROM exported_numbers WHERE batch_id IN ({placeholders})", batch_ids)
+        self._connection.execute(f"DELETE FROM batches WHERE id IN ({placeholders}) AND status = 'reserved'", batch_ids)
+
+    # A run that was killed between reserving and recording never releases its batches
+    def _release_stale_reservations(self) -> None:
+        reserved_before = (datetime.now() - self.RESERVATION_TIMEOUT).isoformat()
+        cursor = self._connection.execute(
+            "SELECT id FROM batches WHERE status = 'reserved' AND created_at < ?", (reserved_before,)
+        )
+        batch_ids = [row[0] for row in cursor]
+
+        if batch_ids:
+            self.release_batches(batch_ids)
+            print(f"{len(batch_ids)} batches reserved before {reserved_before} were released")
+
+    def _insert_keys(self, query: str, keys: pl.Series, *params) -> None:
+        for offset in range(0, len(keys), self.INSERT_CHUNK_SIZE):
+            chunk = keys.slice(offset, self.INSERT_CHUNK_SIZE)
+            self._connection.executemany(query, ((key, *params) for key in chunk))
@@ -0,0 +1,82 @@
+import os
+from collections import defaultdict
+from glob import glob
+from xml.etree.ElementTree import ParseError
+from zipfile import BadZipFile
+
+from src.types.input_files import InputFiles
+from src.utils.excel_probe import probe_excel_file
+
+
+# Raised when the checklist or the blacklist is missing, templates can not be processed without them
+class InputFileNotFoundError(FileNotFoundError):
+    pass
+
+
+class InputFilesDiscovery:
+    ROLES = {
+        "checklist": "checklist_path",
+        "blacklist": "blacklist_path",
+        "template": "templates_path",
+    }
+
+    def __init__(self, config: dict, template_columns: list[str]) -> None:
+        self._config = config
+        self._template_columns = template_columns
+        self._reported_templates = {}
+
+    # Directories shared by several roles are listed only once
+    def discover(self) -> InputFiles:
+        input_files = InputFiles()
+
+        roles_by_directory = defaultdict(list)
+        for role, config_key in self.ROLES.items():
+            roles_by_directory[self._config[config_key]].append(role)
+
+        for directory, roles in roles_by_directory.items():
+            for file_name in glob(f"{directory}/*"):
+                if "checklist" in roles and "ПРОВЕРКА" in file_name:
+                    input_files.checklist_file_name = file_name
+
+                if "blacklist" in roles and "ЧС" in file_name:
+                    input_files.blacklist_file_name = file_name
+
+                if "template" in roles and ("template" in file_name or "Temp" in file_name):
+                    self._add_template(input_files, file_name)
+
+        if not input_files.checklist_file_name:
+            raise InputFileNotFoundError("The ПРОВЕРКА file was not found")
+
+        if not input_files.blacklist_file_name:
+            raise InputFileNotFoundError("The black list file was not found")
+
+        return input_files
+
+    def _add_template(self, input_files: InputFiles, file_name: str) -> None:
+        try:
+            probe = probe_excel_file(file_name)
+        except (BadZipFile, ParseError, KeyError, OSError) as e:
+            self._report_template(file_name, f"The template {file_name} could not be probed: {e}")
+            return
+
+        if not probe.has_data:
+            return
+
+        missing_columns = [column for column in self._template_columns if column not in probe.columns]
+        if missing_columns:
+            missing_columns_string = ", ".join(missing_columns)
+            self._report_template(
+                file_name, f"The template {file_name} was skipped because it has no columns: {missing_columns_string}"
+            )
+            return
+
+        input_files.template_file_names.append(file_name)
+
+    # Repeated discoveries, e.g. in watch mode, report the same unchanged file only once
+    def _report_template(self, file_name: str, message: str) -> None:
+        modified_at = os.stat(file_name).st_mtime_ns
+        if self._reported_templates.get(file_name) == modified_at:
+            return
+
+        self._reported_templates[file_name] = modified_at
+        print(message)
@@ -0,0 +1,80 @@
+import polars as pl
+
+from src.utils.phone_numbers import PHONE_NUMBER_PREFIX
+
+
+class NumberingPlan:
+    ENRICHED_COLUMNS = ["obl_name", "obl_code", "GrS_name", "GrS_code", "UTC_timediff"]
+    PLAN_COLUMNS = ["def_code", "range_from", "range_to"] + ENRICHED_COLUMNS
+
+    # def_code 900, range 0000000-0999999 --> keys 79000000000-79000999999
+    DEF_CODE_MULTIPLIER = 10_000_000
+    PREFIX_KEY = int(PHONE_NUMBER_PREFIX) * 10_000_000_000
+
+    def __init__(self, file_name: str) -> None:
+        self._ranges = self._read_ranges(file_name)
+        print(f"The numbering plan {file_name} with {len(self._ranges)} ranges was loaded")
+
+    def _read_ranges(self, file_name: str) -> pl.DataFrame:
+        if file_name.endswith(".parquet"):
+            df = pl.read_parquet(file_name, columns=self.PLAN_COLUMNS)
+        else:
+            df = pl.read_csv(file_name, columns=self.PLAN_COLUMNS, infer_schema_length=None)
+
+        ranges = (
+            df.with_columns(
+                (self.PREFIX_KEY + pl.col("def_code").cast(pl.Int64) * self.DEF_CODE_MULTIPLIER).alias("_def_key")
+            )
+            .select(
+                (pl.col("_def_key") + pl.col("range_from").cast(pl.Int64)).alias("_start"),
+                (pl.col("_def_key") + pl.col("range_to").cast(pl.Int64)).alias("_end"),
+                *[pl.col(column).alias(f"_plan_{column}") for column in self.ENRICHED_COLUMNS],
+            )
+            .sort("_start")
+        )
+
+        overlapping_ranges_counter = ranges.select((pl.col("_start") <= pl.col("_end").shift(1)).sum()).item()
+        if overlapping_ranges_counter:
+            print(f"{overlapping_ranges_counter} ranges of the numbering plan overlap the previous ones")
+
+        return ranges
+
+    # A row keeps its template values only when all of them are filled, otherwise all of them are taken from the plan,
+    # so region, operator and timezone always come from one source. Template columns take the plan's types, an empty
+    # column is read as Null and a numeric one as String, and a strict cast fails on values that do not fit instead of
+    # nulling them
+    def enrich(self, df: pl.DataFrame | pl.LazyFrame, key_column: str = "Key") -> pl.DataFrame | pl.LazyFrame:
+        schema = df.collect_schema()
+        plan_schema = self._ranges.schema
+        is_in_range = pl.col(key_column) <= pl.col("_end")
+
+        if all(column in schema for column in self.ENRICHED_COLUMNS):
+            is_template_filled = pl.all_horizontal(pl.col(self.ENRICHED_COLUMNS).is_not_null())
+        else:
+            is_template_filled = pl.lit(False)
+
+        enriched_columns = []
+        for column in self.ENRICHED_COLUMNS:
+            plan_column = pl.when(is_in_range).then(pl.col(f"_plan_{column}"))
+
+            if column in schema:
+                template_column = pl.col(column).cast(plan_schema[f"_plan_{column}"], strict=True)
+                enriched_columns.append(
+                    pl.when(is_template_filled).then(template_column).otherwise(plan_column).alias(column)
+                )
+            else:
+                enriched_columns.append(plan_column.alias(column))
+
+        return (
+            df.with_row_index("_row")
+            .sort(key_column, nulls_last=True)
+            .join_asof(
+                self._ranges.lazy() if isinstance(df, pl.LazyFrame) else self._ranges,
+                left_on=key_column,
+                right_on="_start",
+                strategy="backward",
+            )
+            .sort("_row")
+            .with_columns(enriched_columns)
+            .drop("_row", "_start", "_end", *[f"_plan_{column}" for column in self.ENRICHED_COLUMNS])
+        )
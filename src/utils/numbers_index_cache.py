@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+from collections.abc import Callable
+
+import polars as pl
+
+
+class NumbersIndexCache:
+    COMPACTION_THRESHOLD = 16
+    INDEX_VERSION = 2
+
+    def __init__(self, cache_path: str, name: str) -> None:
+        self._cache_path = cache_path
+        self._name = name
+
+        os.makedirs(cache_path, exist_ok=True)
+
+    def load(self, source_file_name: str, read_source: Callable[[str], pl.DataFrame]) -> pl.DataFrame:
+        manifest = self._read_manifest()
+        cached_fingerprint = manifest.get("fingerprint")
+        fingerprint = self._get_fingerprint(source_file_name, cached_fingerprint)
+
+        if self._is_fresh(manifest, fingerprint, cached_fingerprint):
+            print(f"The {self._name} index for {source_file_name} was loaded from cache")
+        else:
+            print(f"The {self._name} index is out of date, rebuilding it from {source_file_name}")
+            index = read_source(source_file_name).unique().sort(pl.all())
+            stale_files = self._get_index_files(manifest)
+
+            if manifest.get("version") != self.INDEX_VERSION:
+                manifest["parts"] = []
+
+            manifest["base"] = f"{self._name}.{fingerprint['sha256'][:16]}.arrow"
+            self._write_index(manifest["base"], index)
+            manifest["parts"] = self._rebase_parts(manifest, index)
+
+            self._remove_files(stale_files - self._get_index_files(manifest))
+
+        manifest["fingerprint"] = fingerprint
+        manifest["version"] = self.INDEX_VERSION
+        self._write_manifest(manifest)
+
+        return self._read_index(manifest)
+
+    # Reads the index as it was last built, without checking the source workbook
+    def read(self) -> pl.DataFrame:
+        manifest = self._read_manifest()
+        if "base" not in manifest:
+            raise RuntimeError(f"The {self._name} index has not been built yet")
+
+        return self._read_index(manifest)
+
+    # Adds numbers to the index as a separate part, so the source workbook is not parsed again
+    def append(self, numbers: pl.DataFrame) -> None:
+        manifest = self._read_manifest()
+        if "fingerprint" not in manifest:
+            raise RuntimeError(f"The {self._name} index has to be built before appending to it")
+
+        new_numbers = numbers.unique().join(self._read_index(manifest), on=numbers.columns, how="anti")
+        if new_numbers.is_empty():
+            return
+
+        parts = manifest.get("parts", [])
+        compacted_parts = []
+        if len(parts) + 1 >= self.COMPACTION_THRESHOLD:
+            new_numbers = pl.concat([self._read_parts(parts), new_numbers])
+            compacted_parts, parts = parts, []
+
+        manifest["parts"] = parts + [self._write_part(manifest, new_numbers)]
+        self._write_manifest(manifest)
+        self._remove_files(set(compacted_parts))
+
+        print(f"{len(new_numbers)} numbers were appended to the {self._name} index")
+
+    @staticmethod
+    def _get_fingerprint(file_name: str, cached_fingerprint: dict | None) -> dict:
+        stat = os.stat(file_name)
+        fingerprint = {
+            "path": os.path.abspath(file_name),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+        }
+
+        # The content is hashed only when the cheap stat fields have changed
+        if cached_fingerprint and all(cached_fingerprint.get(key) == value for key, value in fingerprint.items()):
+            fingerprint["sha256"] = cached_fingerprint["sha256"]
+        else:
+            with open(file_name, "rb") as ifile:
+                fingerprint["sha256"] = hashlib.file_digest(ifile, "sha256").hexdigest()
+
+        return fingerprint
+
+    def _is_fresh(self, manifest: dict, fingerprint: dict, cached_fingerprint: dict | None) -> bool:
+        if manifest.get("version") != self.INDEX_VERSION:
+            return False
+
+        if not cached_fingerprint or not os.path.exists(f"{self._cache_path}/{manifest.get('base')}"):
+            return False
+
+        return all(fingerprint[key] == cached_fingerprint.get(key) for key in ("path", "size", "sha256"))
+
+    # Appended numbers survive a rebuild until the source workbook contains them too
+    def _rebase_parts(self, manifest: dict, index: pl.DataFrame) -> list[str]:
+        parts = manifest.get("parts", [])
+        if not parts:
+            return []
+
+        remaining_numbers = self._read_parts(parts).join(index, on=index.columns, how="anti")
+        if remaining_numbers.is_empty():
+            return []
+
+        return [self._write_part(manifest, remaining_numbers)]
+
+    # Index files are never overwritten in place, because they may still be memory-mapped
+    def _write_part(self, manifest: dict, numbers: pl.DataFrame) -> str:
+        part_number = manifest.get("next_part", 0)
+        manifest["next_part"] = part_number + 1
+
+        part_file_name = f"{self._name}.part-{part_number:06}.arrow"
+        self._write_index(part_file_name, numbers.sort(pl.all()))
+
+        return part_file_name
+
+    def _read_index(self, manifest: dict) -> pl.DataFrame:
+        base = pl.read_ipc(f"{self._cache_path}/{manifest['base']}", memory_map=True)
+        parts = manifest.get("parts", [])
+
+        if not parts:
+            return base
+
+        return pl.concat([base, self._read_parts(parts)])
+
+    def _read_parts(self, parts: list[str]) -> pl.DataFrame:
+        return pl.concat([pl.read_ipc(f"{self._cache_path}/{part}", memory_map=True) for part in parts])
+
+    def _write_index(self, file_name: str, df: pl.DataFrame) -> None:
+        temporary_path = f"{self._cache_path}/{file_name}.tmp"
+        df.write_ipc(temporary_path)
+        os.replace(temporary_path, f"{self._cache_path}/{file_name}")
+
+    @staticmethod
+    def _get_index_files(manifest: dict) -> set[str]:
+        index_files = set(manifest.get("parts", []))
+        if "base" in manifest:
+            index_files.add(manifest["base"])
+
+        return index_files
+
+    def _remove_files(self, file_names: set[str]) -> None:
+        for file_name in file_names:
+            try:
+                os.remove(f"{self._cache_path}/{file_name}")
+            except OSError:
+                pass
+
+    def _get_manifest_path(self) -> str:
+        return f"{self._cache_path}/{self._name}.json"
+
+    def _read_manifest(self) -> dict:
+        if not os.path.exists(self._get_manifest_path()):
+            return {}
+
+        with open(self._get_manifest_path(), "r") as ifile:
+            return json.load(ifile)
+
+    def _write_manifest(self, manifest: dict) -> None:
+        temporary_path = f"{self._get_manifest_path()}.tmp"
+
+        with open(temporary_path, "w") as ofile:
+            json.dump(manifest, ofile, indent=4)
+
+        os.replace(temporary_path, self._get_manifest_path())
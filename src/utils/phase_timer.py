@@ -0,0 +1,31 @@
+from time import perf_counter
+
+
+class PhaseTimer:
+    def __init__(self) -> None:
+        self.seconds = {}
+        self._current_phase = None
+        self._started_at = 0.0
+
+    # Starting a phase stops the current one, a phase entered several times, e.g. once per template, accumulates
+    def start(self, name: str) -> None:
+        self.stop()
+
+        self._current_phase = name
+        self._started_at = perf_counter()
+
+    def stop(self) -> None:
+        if self._current_phase is None:
+            return
+
+        elapsed = perf_counter() - self._started_at
+        self.seconds[self._current_phase] = self.seconds.get(self._current_phase, 0.0) + elapsed
+        self._current_phase = None
+
+    # Time spent in every phase after the snapshot of seconds was taken, e.g. while one template was processed
+    def get_seconds_since(self, snapshot: dict[str, float]) -> dict[str, float]:
+        return {
+            phase: seconds - snapshot.get(phase, 0.0)
+            for phase, seconds in self.seconds.items()
+            if seconds > snapshot.get(phase, 0.0)
+        }
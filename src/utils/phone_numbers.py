@@ -0,0 +1,22 @@
+import polars as pl
+
+PHONE_NUMBER_LENGTH = 11
+PHONE_NUMBER_PREFIX = "7"
+
+
+# 79001234567, "79001234567", 79001234567.0, "+7 (900) 123-45-67", "89001234567" and "9001234567" --> 79001234567
+# Numbers of any other length or prefix --> null
+def get_phone_number_key(column: str) -> pl.Expr:
+    digits = pl.col(column).cast(pl.String).str.replace(r"\.0+$", "").str.replace_all(r"\D", "")
+
+    digits = (
+        pl.when(digits.str.len_chars() == PHONE_NUMBER_LENGTH - 1)
+        .then(PHONE_NUMBER_PREFIX + digits)
+        .when((digits.str.len_chars() == PHONE_NUMBER_LENGTH) & digits.str.starts_with("8"))
+        .then(PHONE_NUMBER_PREFIX + digits.str.slice(1))
+        .otherwise(digits)
+    )
+
+    is_valid = (digits.str.len_chars() == PHONE_NUMBER_LENGTH) & digits.str.starts_with(PHONE_NUMBER_PREFIX)
+
+    return pl.when(is_valid).then(digits.cast(pl.Int64, strict=False))
@@ -0,0 +1,19 @@
+from threading import Lock
+from time import monotonic, sleep
+
+
+class RateLimiter:
+    def __init__(self, interval_seconds: float) -> None:
+        self._interval_seconds = interval_seconds
+        self._lock = Lock()
+        self._next_request_at = 0.0
+
+    # Requests start at least interval_seconds apart, whichever thread makes them
+    def wait(self) -> None:
+        with self._lock:
+            now = monotonic()
+            wait_seconds = self._next_request_at - now
+            self._next_request_at = max(now, self._next_request_at) + self._interval_seconds
+
+        if wait_seconds > 0:
+            sleep(wait_seconds)